@@ -0,0 +1,281 @@
+"""
+Async database API used by the webhook handlers
+
+Mirrors the db_helper functions the handlers need as coroutines. With
+DB_ASYNC=1 and the optional aiomysql driver installed, queries run natively
+on an asyncio connection pool, so one worker can keep many orders in
+flight without a thread per query. Otherwise each call is handed to the
+DB thread pool and runs the regular db_helper function.
+
+Both paths share db_helper's SQL statement registry, order status cache
+and return-value conventions.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+import db_helper
+import tracing
+from cache import MISSING
+from offload import db_executor
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+logger = logging.getLogger(__name__)
+
+# Use the native asyncio MySQL driver when available
+DB_ASYNC = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes")
+
+_DRIVER_ERRORS = (aiomysql.Error,) if aiomysql else ()
+
+
+class AsyncMySQLBackend:
+    """aiomysql connection pool executing db_helper's registered statements"""
+
+    def __init__(self, config, statements):
+        self._config = config
+        self._statements = statements
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _get_pool(self):
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await aiomysql.create_pool(
+                        host=self._config["host"],
+                        user=self._config["user"],
+                        password=self._config["password"],
+                        db=self._config["database"],
+                        charset=self._config["charset"],
+                        autocommit=False,
+                        minsize=1,
+                        maxsize=db_helper.DB_POOL_SIZE,
+                        pool_recycle=db_helper.DB_POOL_RECYCLE or -1
+                    )
+                    logger.info("Created asyncio MySQL connection pool")
+        return self._pool
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Check out a connection; uncommitted work is rolled back on exit
+
+        aiomysql closes a released connection that is still in a transaction,
+        and with autocommit off even a lone SELECT opens one. Rolling back
+        here, like ConnectionPool.connection, keeps read-only callers from
+        reconnecting on every call.
+        """
+        pool = await self._get_pool()
+        conn = await asyncio.wait_for(pool.acquire(), db_helper.DB_POOL_TIMEOUT)
+        try:
+            yield conn
+        finally:
+            try:
+                if conn.get_transaction_status():
+                    await conn.rollback()
+            except Exception:
+                conn.close()
+            pool.release(conn)
+
+    async def execute(self, cursor, name, params=(), size=None):
+        """Execute a registered statement and record its latency"""
+        _, sql = self._statements.resolve(name, size)
+        started = time.perf_counter()
+        try:
+            await cursor.execute(sql, params)
+        except Exception:
+            self._statements.record(name, time.perf_counter() - started, failed=True)
+            raise
+        self._statements.record(name, time.perf_counter() - started)
+        return cursor
+
+    def stats(self):
+        if self._pool is None:
+            return {"size": db_helper.DB_POOL_SIZE, "open": 0, "idle": 0}
+        return {
+            "size": self._pool.maxsize,
+            "open": self._pool.size,
+            "idle": self._pool.freesize,
+        }
+
+
+def _create_backend():
+    if not DB_ASYNC:
+        return None
+    if db_helper.DB_BACKEND != "mysql":
+        logger.info("DB_ASYNC ignored for %s backend; using DB thread pool", db_helper.DB_BACKEND)
+        return None
+    if aiomysql is None:
+        logger.warning("DB_ASYNC is set but aiomysql is not installed; using DB thread pool")
+        return None
+    logger.info("Using native asyncio MySQL driver")
+    return AsyncMySQLBackend(db_helper.DB_CONFIG, db_helper.statements)
+
+
+_native = _create_backend()
+
+
+def backend_stats():
+    """Return native async pool statistics, or None when using the thread pool"""
+    return _native.stats() if _native else None
+
+
+async def is_connected():
+    if _native is None:
+        return await db_executor.run(db_helper.is_connected)
+    try:
+        async with _native.connection() as conn:
+            await conn.ping(reconnect=False)
+        return True
+    except Exception:
+        return False
+
+
+@tracing.traced()
+async def insert_order(order_id, lines, status="in progress"):
+    """Async db_helper.insert_order: all lines plus tracking in one transaction"""
+    if _native is None:
+        return await db_executor.run(db_helper.insert_order, order_id, lines, status)
+
+    rows = [(order_id, item_id, quantity, total_price) for item_id, quantity, total_price in lines]
+    if not rows:
+        logger.error("Refusing to insert empty order %s", order_id)
+        return -1
+
+    try:
+        async with _native.connection() as conn:
+            async with conn.cursor() as cursor:
+                params = [value for row in rows for value in row]
+                await _native.execute(cursor, "insert_order_lines", params, size=len(rows))
+                await _native.execute(cursor, "insert_order_tracking", (order_id, status))
+            await conn.commit()
+
+        db_helper.order_status_cache.set(order_id, status)
+        logger.info("Order ID %s inserted with %s items, status: %s", order_id, len(rows), status)
+        return 1
+
+    except _DRIVER_ERRORS as err:
+        logger.error("Error inserting order: %s", err)
+        return -1
+
+    except Exception as e:
+        logger.error("An unexpected error occurred: %s", e)
+        return -1
+
+
+@tracing.traced()
+async def reserve_order_id_block(count):
+    """Async db_helper.reserve_order_id_block"""
+    if _native is None:
+        return await db_executor.run(db_helper.reserve_order_id_block, count)
+
+    try:
+        async with _native.connection() as conn:
+            async with conn.cursor() as cursor:
+                if not db_helper.order_sequence_ready:
+                    # Databases from before the sequence table (or from interactive_setup.py) lack it
+                    await _native.execute(cursor, "create_order_sequence")
+                await _native.execute(cursor, "advance_order_sequence", (count,))
+                if cursor.rowcount == 0:
+                    # The sequence row is missing: seed it from the existing orders
+                    await _native.execute(cursor, "seed_order_sequence")
+                    await _native.execute(cursor, "advance_order_sequence", (count,))
+                await _native.execute(cursor, "select_reserved_block_end")
+                block_end = (await cursor.fetchone())[0]
+            await conn.commit()
+            db_helper.order_sequence_ready = True
+
+        block_start = block_end - count
+        logger.info("Reserved order IDs %s..%s", block_start, block_end - 1)
+        return block_start
+
+    except _DRIVER_ERRORS as err:
+        logger.error("Error reserving order IDs: %s", err)
+        return -1
+
+    except Exception as e:
+        logger.error("An unexpected error occurred: %s", e)
+        return -1
+
+
+class AsyncOrderIdAllocator:
+    """Coroutine counterpart of db_helper.OrderIdAllocator"""
+
+    def __init__(self, block_size=db_helper.ORDER_ID_BLOCK_SIZE):
+        self.block_size = block_size
+        self._next = 0
+        self._limit = 0
+        self._lock = asyncio.Lock()
+
+    async def next_id(self):
+        async with self._lock:
+            if self._next >= self._limit:
+                block_start = await reserve_order_id_block(self.block_size)
+                if block_start == -1:
+                    return -1
+                self._next = block_start
+                self._limit = block_start + self.block_size
+            order_id = self._next
+            self._next += 1
+            return order_id
+
+
+_order_id_allocator = AsyncOrderIdAllocator() if _native else None
+
+
+@tracing.traced()
+async def get_next_order_id():
+    """Async db_helper.get_next_order_id"""
+    if _native is None:
+        # The sync allocator serves most IDs from memory; only hop to the
+        # DB thread pool when a new block has to be reserved
+        next_id = db_helper.order_id_allocator.try_next_id()
+        if next_id is not None:
+            return next_id
+        return await db_executor.run(db_helper.get_next_order_id)
+    next_id = await _order_id_allocator.next_id()
+    if next_id != -1:
+        logger.info("Next order ID: %s", next_id)
+    return next_id
+
+
+@tracing.traced()
+async def get_order_status(order_id):
+    """Async db_helper.get_order_status, answering from the status cache first"""
+    cached = db_helper.order_status_cache.get(order_id)
+    if cached is not MISSING:
+        return cached
+
+    if _native is None:
+        # The cache was just checked: pass use_cache=False so the miss is not counted twice
+        return await db_executor.run(db_helper.get_order_status, order_id, False)
+
+    try:
+        async with _native.connection() as conn:
+            async with conn.cursor() as cursor:
+                await _native.execute(cursor, "select_order_status", (order_id,))
+                result = await cursor.fetchone()
+
+        if result:
+            logger.info("Status for order ID %s: %s", order_id, result[0])
+            db_helper.order_status_cache.set(order_id, result[0])
+            return result[0]
+        else:
+            logger.warning("No status found for order ID %s", order_id)
+            db_helper.order_status_cache.set(order_id, None, ttl=db_helper.ORDER_STATUS_NEGATIVE_TTL)
+            return None
+
+    except _DRIVER_ERRORS as err:
+        logger.error("Error getting order status: %s", err)
+        return None
+
+    except Exception as e:
+        logger.error("An unexpected error occurred: %s", e)
+        return None
@@ -0,0 +1,102 @@
+"""
+Microbenchmarks for the webhook hot path
+
+Run with: python bench.py [iterations]
+"""
+
+import json
+import re
+import sys
+import timeit
+
+from fastapi.responses import JSONResponse
+
+import generic_helper
+import json_codec
+
+
+def sample_webhook_payload(contexts=12):
+    """Build a Dialogflow WebhookRequest with many output contexts"""
+    session = "projects/pandeyji-eatery-abcd/agent/sessions/2b1c9f3e-6d4a-4e8b-9a51-0c7d2f6e8a13"
+    return {
+        "responseId": "8f1e3c2a-5b7d-4c9e-a1f0-3d6b8e2c4a7f-b81332aa",
+        "session": session,
+        "queryResult": {
+            "queryText": "add two pizzas and one mango lassi",
+            "parameters": {"food-item": ["Pizza", "Mango Lassi"], "number": [2, 1]},
+            "allRequiredParamsPresent": True,
+            "fulfillmentMessages": [{"text": {"text": [""]}}],
+            "outputContexts": [
+                {
+                    "name": f"{session}/contexts/ongoing-order-{index}",
+                    "lifespanCount": 5,
+                    "parameters": {
+                        "food-item": ["Pizza", "Mango Lassi"],
+                        "food-item.original": ["pizzas", "mango lassi"],
+                        "number": [2, 1],
+                        "number.original": ["two", "one"],
+                    },
+                }
+                for index in range(contexts)
+            ],
+            "intent": {
+                "name": "projects/pandeyji-eatery-abcd/agent/intents/6a0b8c1d-2e3f-4a5b-8c7d-9e0f1a2b3c4d",
+                "displayName": "order.add - context: ongoing-order",
+            },
+            "intentDetectionConfidence": 1,
+            "languageCode": "en",
+        },
+        "originalDetectIntentRequest": {"source": "DIALOGFLOW_CONSOLE", "payload": {}},
+    }
+
+
+def report(name, baseline, candidate, iterations, candidate_name=None):
+    print(f"{name:<28} before {baseline / iterations * 1e6:8.2f} us   "
+          f"{candidate_name or json_codec.BACKEND:>9} {candidate / iterations * 1e6:8.2f} us   "
+          f"x{baseline / candidate:.2f}")
+
+
+def bench_json(iterations):
+    """Request parsing and response rendering, stdlib json vs json_codec"""
+    body = json.dumps(sample_webhook_payload()).encode("utf-8")
+    response = {"fulfillmentText": "Great! I've added that to your order. So far you have: "
+                                   "2 Pizza, 1 Mango Lassi. Would you like to add anything else?"}
+    assert json_codec.loads(body) == json.loads(body)
+
+    report("parse webhook request",
+           timeit.timeit(lambda: json.loads(body), number=iterations),
+           timeit.timeit(lambda: json_codec.loads(body), number=iterations),
+           iterations)
+    report("render fulfillment response",
+           timeit.timeit(lambda: JSONResponse(content=response), number=iterations),
+           timeit.timeit(lambda: json_codec.FastJSONResponse(content=response), number=iterations),
+           iterations)
+
+
+def bench_session_id(iterations):
+    """Session ID extraction: the old uncompiled regex vs generic_helper"""
+    context_name = sample_webhook_payload()["queryResult"]["outputContexts"][0]["name"]
+
+    def regex_extract(session_str):
+        match = re.search(r"/sessions/(.*?)/contexts/", session_str)
+        return match.group(1) if match else ""
+
+    assert regex_extract(context_name) == generic_helper.extract_session_id(context_name)
+    baseline = timeit.timeit(lambda: regex_extract(context_name), number=iterations)
+    report("extract session id (miss)", baseline,
+           timeit.timeit(lambda: generic_helper.extract_session_id.__wrapped__(context_name), number=iterations),
+           iterations, "partition")
+    report("extract session id (memo)", baseline,
+           timeit.timeit(lambda: generic_helper.extract_session_id(context_name), number=iterations),
+           iterations, "partition")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"JSON codec backend: {json_codec.BACKEND}, {iterations} iterations")
+    bench_json(iterations)
+    bench_session_id(iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Small in-process caches shared by the application modules
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+# Returned by TTLCache.get() when a key is absent or expired, so that None
+# can be cached as a legitimate (negative) value
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire after a time-to-live
+
+    Entries are kept in an OrderedDict in least-recently-used order, so both
+    lookups and evictions are O(1). Each entry may override the default TTL,
+    which is how short-lived negative results are stored.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, or MISSING if absent or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return MISSING
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entry when full"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class ResponseDeduper:
+    """
+    Runs a coroutine at most once per key and replays its result to duplicates
+
+    Completed results are kept in a TTLCache. A duplicate that arrives while
+    the first call is still running waits for that call instead of starting
+    its own. If the first call raises, a waiting duplicate runs normally.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._results = TTLCache(maxsize, ttl)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.duplicates = 0
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        counted = False
+        while True:
+            result = self._results.get(key)
+            if result is not MISSING:
+                if not counted:
+                    self.duplicates += 1
+                return result
+
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            if not counted:
+                self.duplicates += 1
+                counted = True
+            await asyncio.wait([future])
+            if not future.cancelled():
+                return future.result()
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            self._results.set(key, result)
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._results.stats()
+        stats["in_flight"] = len(self._inflight)
+        stats["duplicates"] = self.duplicates
+        return stats
@@ -0,0 +1,137 @@
+"""
+Compact in-progress cart
+
+A cart used to be a dict of free-text food names to quantities, and its
+summary text was rebuilt on every add. Cart stores (menu item ID, quantity)
+pairs interleaved in a single unsigned-int array, keeps the running total
+in cents, and extends its summary text in place when a new item is added.
+"""
+
+import struct
+from array import array
+from typing import Iterator, Optional, Tuple
+
+from menu import Menu, MenuItem
+
+# line count, total cents, menu version the total was computed with
+_HEADER = struct.Struct("<III")
+# Largest quantity or total (in cents) the array and header can hold
+MAX_UINT32 = 0xFFFFFFFF
+
+
+class Cart:
+    """Item IDs and quantities of one session's order, in insertion order"""
+
+    __slots__ = ("_lines", "total_cents", "menu_version", "_summary")
+
+    def __init__(self, menu_version: int = 0):
+        # item_id, quantity, item_id, quantity, ...
+        self._lines = array("I")
+        self.total_cents = 0
+        self.menu_version = menu_version
+        # Cached "2 Pizza, 1 Biryani" text; None until built or after an edit
+        self._summary: Optional[str] = ""
+
+    def __len__(self) -> int:
+        return len(self._lines) // 2
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        lines = self._lines
+        return zip(lines[0::2], lines[1::2])
+
+    def __contains__(self, item_id: int) -> bool:
+        return self._index(item_id) >= 0
+
+    def as_dict(self) -> dict:
+        return dict(self)
+
+    def __repr__(self) -> str:
+        # Built only when a log record that includes the cart is actually written
+        return f"Cart({self.as_dict()}, total_cents={self.total_cents})"
+
+    def _index(self, item_id: int) -> int:
+        # Position of the item's ID in _lines, or -1; carts only hold a few lines
+        lines = self._lines
+        for index in range(0, len(lines), 2):
+            if lines[index] == item_id:
+                return index
+        return -1
+
+    def add(self, item: MenuItem, quantity: int) -> None:
+        """
+        Add a quantity of a menu item, merging with an existing line
+
+        Raises:
+            ValueError: If the quantity or the new total does not fit the
+                cart's unsigned 32-bit fields; the cart is left unchanged
+        """
+        index = self._index(item.item_id)
+        line_quantity = quantity + (self._lines[index + 1] if index >= 0 else 0)
+        total_cents = self.total_cents + item.price_cents * quantity
+        if quantity <= 0 or line_quantity > MAX_UINT32 or total_cents > MAX_UINT32:
+            raise ValueError(f"Cannot add {quantity} {item.name} to the cart")
+        if index < 0:
+            # One extend, so an ID is never stored without its quantity
+            self._lines.extend((item.item_id, quantity))
+            if self._summary is not None:
+                line = f"{quantity} {item.name}"
+                self._summary = f"{self._summary}, {line}" if self._summary else line
+        else:
+            self._lines[index + 1] = line_quantity
+            self._summary = None
+        self.total_cents = total_cents
+
+    def remove(self, item: MenuItem) -> bool:
+        """Remove a menu item's line; returns False if it was not in the cart"""
+        index = self._index(item.item_id)
+        if index < 0:
+            return False
+        self.total_cents -= item.price_cents * self._lines[index + 1]
+        del self._lines[index:index + 2]
+        self._summary = None
+        return True
+
+    def copy(self) -> "Cart":
+        """Independent copy, for edits that must not touch the stored cart until they succeed"""
+        cart = Cart.__new__(Cart)
+        cart._lines = array("I", self._lines)
+        cart.total_cents = self.total_cents
+        cart.menu_version = self.menu_version
+        cart._summary = self._summary
+        return cart
+
+    def reprice(self, menu: Menu) -> None:
+        """Recompute the running total against a newer menu version"""
+        total_cents = 0
+        for item_id, quantity in self:
+            item = menu.get_by_id(item_id)
+            if item is not None:
+                total_cents += item.price_cents * quantity
+        self.total_cents = total_cents
+        self.menu_version = menu.version
+        self._summary = None
+
+    def summary(self, menu: Menu) -> str:
+        """Return the "2 Pizza, 1 Biryani" text, rebuilding it only after edits"""
+        if self._summary is None:
+            parts = []
+            for item_id, quantity in self:
+                item = menu.get_by_id(item_id)
+                parts.append(f"{quantity} {item.name if item else f'item #{item_id}'}")
+            self._summary = ", ".join(parts)
+        return self._summary
+
+    def to_bytes(self) -> bytes:
+        """Serialize to a compact binary form (native array byte order)"""
+        return _HEADER.pack(len(self), self.total_cents, self.menu_version) + self._lines.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Cart":
+        # Skips __init__; this runs once per cart when sessions are recovered
+        cart = cls.__new__(cls)
+        count, cart.total_cents, cart.menu_version = _HEADER.unpack_from(data)
+        lines = array("I")
+        lines.frombytes(data[_HEADER.size:_HEADER.size + lines.itemsize * 2 * count])
+        cart._lines = lines
+        cart._summary = None
+        return cart
@@ -4,20 +4,18 @@ import mysql.connector
 from mysql.connector import Error
 import logging
 import os
+import sqlite3
+import threading
 from dotenv import load_dotenv
 
+import metrics
+import tracing
+from cache import MISSING, TTLCache
+from db_pool import ConnectionPool, PoolTimeoutError, StatementRegistry
+
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # Database configuration from environment variables with fallbacks
@@ -51,220 +49,585 @@ def get_db_connection():
             return connection
     except Error as e:
         if "Access denied" in str(e):
-            logger.error(f"Database access denied. Please check your credentials in .env file: {e}")
+            logger.error("Database access denied. Please check your credentials in .env file: %s", e)
         elif "Unknown database" in str(e):
-            logger.error(f"Database '{DB_CONFIG['database']}' does not exist. Please create it first: {e}")
+            logger.error("Database '%s' does not exist. Please create it first: %s", DB_CONFIG['database'], e)
         else:
-            logger.error(f"Error connecting to MySQL database: {e}")
+            logger.error("Error connecting to MySQL database: %s", e)
         return None
     except Exception as e:
-        logger.error(f"Unexpected error connecting to database: {e}")
+        logger.error("Unexpected error connecting to database: %s", e)
         return None
 
-# Global connection object - initialize as None to handle connection failures gracefully
-cnx = None
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# Ping pooled connections idle longer than this many seconds before reuse
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", 30))
+
+
+# MySQL statements, executed as server-side prepared statements
+statements = StatementRegistry()
+statements.register("insert_order_item", "CALL insert_order_item(%s, %s, %s)")
+statements.register_sized(
+    "insert_order_lines",
+    lambda size: "INSERT INTO orders (order_id, item_id, quantity, total_price) VALUES "
+                 + ", ".join(["(%s, %s, %s, %s)"] * size)
+)
+statements.register("insert_order_tracking", "INSERT INTO order_tracking (order_id, status) VALUES (%s, %s)")
+statements.register("update_order_status", "UPDATE order_tracking SET status = %s WHERE order_id = %s")
+statements.register("select_order_total", "SELECT get_total_order_price(%s)")
+statements.register("select_food_items", "SELECT item_id, name, price FROM food_items ORDER BY item_id")
+statements.register(
+    "create_order_sequence",
+    "CREATE TABLE IF NOT EXISTS order_id_sequence (name VARCHAR(64) PRIMARY KEY, next_id INT NOT NULL)"
+)
+statements.register(
+    "advance_order_sequence",
+    "UPDATE order_id_sequence SET next_id = LAST_INSERT_ID(next_id + %s) WHERE name = 'orders'"
+)
+statements.register(
+    "seed_order_sequence",
+    "INSERT IGNORE INTO order_id_sequence (name, next_id) "
+    "SELECT 'orders', IFNULL(MAX(order_id), 0) + 1 FROM orders"
+)
+statements.register("select_reserved_block_end", "SELECT LAST_INSERT_ID()")
+statements.register("select_order_status", "SELECT status FROM order_tracking WHERE order_id = %s")
+statements.register_sized(
+    "select_order_statuses",
+    lambda size: "SELECT order_id, status FROM order_tracking WHERE order_id IN ("
+                 + ", ".join(["%s"] * size) + ")"
+)
+
+
+# Storage backend: "mysql" (default) or "sqlite" to run without a MySQL server
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+
+# Driver errors raised by either backend
+DatabaseError = (mysql.connector.Error, sqlite3.Error)
+# Errors meaning the database could not be reached, rather than that it rejected a statement
+UnavailableError = (PoolTimeoutError, mysql.connector.errors.InterfaceError,
+                    mysql.connector.errors.OperationalError, sqlite3.OperationalError)
+
+# Global connection pool - shared by every query function below
+if DB_BACKEND == "sqlite":
+    import sqlite_backend
+    sqlite_backend.statements.add_observer(metrics.observe_statement)
+    sqlite_backend.statements.add_observer(tracing.observe_statement)
+    pool = ConnectionPool(sqlite_backend.connect, sqlite_backend.statements,
+                          DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PING_AFTER)
+else:
+    statements.add_observer(metrics.observe_statement)
+    statements.add_observer(tracing.observe_statement)
+    pool = ConnectionPool(get_db_connection, statements,
+                          DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PING_AFTER)
+logger.info("Using %s storage backend", DB_BACKEND)
+
+
+def statement_stats():
+    """Return per-statement call counts and latencies"""
+    return pool.statements.stats()
 
 try:
-    cnx = get_db_connection()
-    if not cnx:
-        logger.warning("Database connection not established. Some features may not work properly.")
+    # Warm the pool with one connection so configuration problems show up at startup
+    with pool.connection() as connection:
+        if not connection:
+            logger.warning("Database connection not established. Some features may not work properly.")
 except Exception as e:
-    logger.error(f"Failed to initialize database connection: {str(e)}", exc_info=True)
+    logger.error("Failed to initialize database connection: %s", e, exc_info=True)
+
+
+def is_connected():
+    """Check whether a pooled connection to the database can be used"""
+    try:
+        with pool.connection() as connection:
+            return bool(connection and connection.is_connected())
+    except Exception:
+        return False
+
+
+def pool_stats():
+    """Return connection pool statistics for health reporting"""
+    return pool.stats()
+
+
+# Order status cache settings
+ORDER_STATUS_CACHE_SIZE = int(os.getenv("ORDER_STATUS_CACHE_SIZE", 10000))
+ORDER_STATUS_CACHE_TTL = float(os.getenv("ORDER_STATUS_CACHE_TTL", 60))
+ORDER_STATUS_NEGATIVE_TTL = float(os.getenv("ORDER_STATUS_NEGATIVE_TTL", 5))
+
+# Maximum number of order IDs per IN (...) query in get_order_statuses
+ORDER_STATUS_CHUNK_SIZE = 500
+ORDER_STATUS_IN_BUCKETS = (1, 8, 32, 128, ORDER_STATUS_CHUNK_SIZE)
+
+# Read-through cache in front of get_order_status, kept current by every write
+order_status_cache = TTLCache(ORDER_STATUS_CACHE_SIZE, ORDER_STATUS_CACHE_TTL)
+
+
+def order_status_cache_stats():
+    """Return order status cache statistics for health reporting"""
+    return order_status_cache.stats()
+
 
 # Function to call the MySQL stored procedure and insert an order item
+@metrics.db_function_latency.time()
+@tracing.traced()
 def insert_order_item(food_item, quantity, order_id):
-    connection = None
-    cursor = None
     try:
-        # Get a new connection if the global one is not available
-        connection = cnx if cnx and cnx.is_connected() else get_db_connection()
-        if not connection:
-            logger.error("Failed to get database connection")
-            return -1
+        with pool.connection() as connection:
+            if not connection:
+                logger.error("Failed to get database connection")
+                return -1
+
+            # Calling the stored procedure
+            connection.execute("insert_order_item", (food_item, quantity, order_id))
 
-        cursor = connection.cursor()
+            # Committing the changes
+            connection.commit()
+
+        logger.info("Order item '%s' (qty: %s) inserted successfully for order ID: %s", food_item, quantity, order_id)
+        return 1
 
-        # Calling the stored procedure
-        cursor.callproc('insert_order_item', (food_item, quantity, order_id))
+    except DatabaseError as err:
+        # Uncommitted changes are rolled back when the connection returns to the pool
+        logger.error("Error inserting order item: %s", err)
+        return -1
 
-        # Committing the changes
-        connection.commit()
+    except Exception as e:
+        logger.error("An unexpected error occurred: %s", e)
+        return -1
 
-        logger.info(f"Order item '{food_item}' (qty: {quantity}) inserted successfully for order ID: {order_id}")
+# Function to insert a complete order (all items plus tracking) in one transaction
+@metrics.db_function_latency.time()
+@tracing.traced()
+def insert_order(order_id, lines, status="in progress"):
+    """
+    Insert every line of an order and its tracking row in a single transaction
+
+    Lines are already resolved against the in-memory menu, so no food_items
+    lookup is needed. All item rows go into one multi-row INSERT, keeping the
+    cost at one round trip regardless of cart size.
+
+    Args:
+        order_id: ID of the order being inserted
+        lines: Iterable of (item_id, quantity, total_price) tuples
+        status: Initial tracking status
+
+    Returns:
+        int: 1 if successful, -1 if there was an error
+    """
+    rows = [(order_id, item_id, quantity, total_price) for item_id, quantity, total_price in lines]
+    params = [value for row in rows for value in row]
+    if not rows:
+        logger.error("Refusing to insert empty order %s", order_id)
+        return -1
+
+    try:
+        with pool.connection() as connection:
+            if not connection:
+                logger.error("Failed to get database connection")
+                return -1
+
+            connection.execute("insert_order_lines", params, size=len(rows))
+            connection.execute("insert_order_tracking", (order_id, status))
+
+            # Single commit for the whole order
+            connection.commit()
+
+        order_status_cache.set(order_id, status)
+        logger.info("Order ID %s inserted with %s items, status: %s", order_id, len(rows), status)
         return 1
 
-    except mysql.connector.Error as err:
-        logger.error(f"Error inserting order item: {err}")
-        # Rollback changes if necessary
-        if connection:
-            connection.rollback()
+    except DatabaseError as err:
+        logger.error("Error inserting order: %s", err)
         return -1
 
     except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
-        # Rollback changes if necessary
-        if connection:
-            connection.rollback()
+        logger.error("An unexpected error occurred: %s", e)
+        return -1
+
+# Function to insert several complete orders in one transaction
+@metrics.db_function_latency.time()
+@tracing.traced()
+def insert_orders(orders):
+    """
+    Insert many orders (items plus tracking rows) with a single commit
+
+    Used by the write-behind journal to apply accepted orders in batches.
+
+    Args:
+        orders: List of (order_id, lines, status) with lines as
+            (item_id, quantity, total_price) tuples
+
+    Returns:
+        int: 1 if every order was inserted, 0 if the database could not be
+        reached and -1 if it rejected the orders (nothing is committed
+        in either case)
+    """
+    try:
+        with pool.connection() as connection:
+            if not connection:
+                logger.error("Failed to get database connection")
+                return 0
+
+            for order_id, lines, status in orders:
+                params = [value for item_id, quantity, total_price in lines
+                          for value in (order_id, item_id, quantity, total_price)]
+                connection.execute("insert_order_lines", params, size=len(lines))
+                connection.execute("insert_order_tracking", (order_id, status))
+
+            connection.commit()
+
+        for order_id, _, status in orders:
+            order_status_cache.set(order_id, status)
+        logger.info("Inserted batch of %s orders", len(orders))
+        return 1
+
+    except UnavailableError as err:
+        logger.error("Database unavailable while inserting order batch: %s", err)
+        return 0
+
+    except DatabaseError as err:
+        logger.error("Error inserting order batch: %s", err)
         return -1
 
-    finally:
-        # Closing the cursor
-        if cursor:
-            cursor.close()
+    except Exception as e:
+        logger.error("An unexpected error occurred: %s", e)
+        return -1
 
 # Function to insert a record into the order_tracking table
+@metrics.db_function_latency.time()
+@tracing.traced()
 def insert_order_tracking(order_id, status):
-    connection = None
-    cursor = None
     try:
-        # Get a new connection if the global one is not available
-        connection = cnx if cnx and cnx.is_connected() else get_db_connection()
-        if not connection:
-            logger.error("Failed to get database connection")
-            return -1
+        with pool.connection() as connection:
+            if not connection:
+                logger.error("Failed to get database connection")
+                return -1
 
-        cursor = connection.cursor()
+            # Inserting the record into the order_tracking table
+            connection.execute("insert_order_tracking", (order_id, status))
 
-        # Inserting the record into the order_tracking table
-        insert_query = "INSERT INTO order_tracking (order_id, status) VALUES (%s, %s)"
-        cursor.execute(insert_query, (order_id, status))
+            # Committing the changes
+            connection.commit()
 
-        # Committing the changes
-        connection.commit()
-
-        logger.info(f"Order tracking inserted successfully for order ID: {order_id}, status: {status}")
+        order_status_cache.set(order_id, status)
+        logger.info("Order tracking inserted successfully for order ID: %s, status: %s", order_id, status)
         return 1
 
-    except mysql.connector.Error as err:
-        logger.error(f"Error inserting order tracking: {err}")
-        if connection:
-            connection.rollback()
+    except DatabaseError as err:
+        logger.error("Error inserting order tracking: %s", err)
         return -1
 
     except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
-        if connection:
-            connection.rollback()
+        logger.error("An unexpected error occurred: %s", e)
         return -1
 
-    finally:
-        # Closing the cursor
-        if cursor:
-            cursor.close()
-
-def get_total_order_price(order_id):
-    connection = None
-    cursor = None
+# Function to change the status of an existing order
+@metrics.db_function_latency.time()
+@tracing.traced()
+def update_order_status(order_id, status):
     try:
-        # Get a new connection if the global one is not available
-        connection = cnx if cnx and cnx.is_connected() else get_db_connection()
-        if not connection:
-            logger.error("Failed to get database connection")
-            return 0
+        with pool.connection() as connection:
+            if not connection:
+                logger.error("Failed to get database connection")
+                return -1
 
-        cursor = connection.cursor()
+            updated = connection.execute("update_order_status", (status, order_id)).rowcount
+            connection.commit()
 
-        # Executing the SQL query to get the total order price
-        query = f"SELECT get_total_order_price({order_id})"
-        cursor.execute(query)
+        if updated == 0:
+            logger.warning("No order tracking row to update for order ID: %s", order_id)
+            return -1
 
-        # Fetching the result
-        result = cursor.fetchone()[0]
+        order_status_cache.set(order_id, status)
+        logger.info("Order status updated for order ID: %s, status: %s", order_id, status)
+        return 1
 
-        logger.info(f"Total price for order ID {order_id}: {result}")
+    except DatabaseError as err:
+        logger.error("Error updating order status: %s", err)
+        return -1
+
+    except Exception as e:
+        logger.error("An unexpected error occurred: %s", e)
+        return -1
+
+@metrics.db_function_latency.time()
+@tracing.traced()
+def get_total_order_price(order_id):
+    try:
+        with pool.connection() as connection:
+            if not connection:
+                logger.error("Failed to get database connection")
+                return 0
+
+            # Executing the SQL query to get the total order price
+            result = connection.execute("select_order_total", (order_id,)).fetchall()[0][0]
+
+        logger.info("Total price for order ID %s: %s", order_id, result)
         return result
 
-    except mysql.connector.Error as err:
-        logger.error(f"Error getting total order price: {err}")
+    except DatabaseError as err:
+        logger.error("Error getting total order price: %s", err)
         return 0
 
     except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
+        logger.error("An unexpected error occurred: %s", e)
         return 0
 
-    finally:
-        # Closing the cursor
-        if cursor:
-            cursor.close()
+# Function to load the menu from the food_items table
+@metrics.db_function_latency.time()
+@tracing.traced()
+def fetch_food_items():
+    """
+    Load every menu item
 
-# Function to get the next available order_id
-def get_next_order_id():
-    connection = None
-    cursor = None
+    Returns:
+        list: (item_id, name, price) tuples, or None if there was an error
+    """
     try:
-        # Get a new connection if the global one is not available
-        connection = cnx if cnx and cnx.is_connected() else get_db_connection()
-        if not connection:
-            logger.error("Failed to get database connection")
-            return 1
+        with pool.connection() as connection:
+            if not connection:
+                logger.error("Failed to get database connection")
+                return None
+
+            rows = connection.execute("select_food_items").fetchall()
+
+        logger.info("Fetched %s food items", len(rows))
+        return rows
 
-        cursor = connection.cursor()
+    except DatabaseError as err:
+        logger.error("Error fetching food items: %s", err)
+        return None
 
-        # Executing the SQL query to get the next available order_id
-        query = "SELECT MAX(order_id) FROM orders"
-        cursor.execute(query)
+    except Exception as e:
+        logger.error("An unexpected error occurred: %s", e)
+        return None
 
-        # Fetching the result
-        result = cursor.fetchone()[0]
+# Number of order IDs reserved per database round trip (hi/lo allocation)
+ORDER_ID_BLOCK_SIZE = max(1, int(os.getenv("ORDER_ID_BLOCK_SIZE", 10)))
 
-        # Returning the next available order_id
-        next_id = 1 if result is None else result + 1
-        logger.info(f"Next order ID: {next_id}")
-        return next_id
 
-    except mysql.connector.Error as err:
-        logger.error(f"Error getting next order ID: {err}")
-        return 1
+# Set once this process has made sure the order_id_sequence table exists
+order_sequence_ready = False
 
-    except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
-        return 1
 
-    finally:
-        # Closing the cursor
-        if cursor:
-            cursor.close()
+# Function to atomically reserve a contiguous block of order IDs
+@metrics.db_function_latency.time()
+@tracing.traced()
+def reserve_order_id_block(count):
+    """
+    Reserve ``count`` consecutive order IDs from the order_id_sequence table
+
+    The sequence row is advanced with UPDATE ... LAST_INSERT_ID(), which is
+    atomic per row, so concurrent callers (threads or processes) always get
+    disjoint blocks. The table is created and its row seeded from
+    MAX(order_id) on first use, so databases set up before the table
+    existed keep working.
 
-# Function to fetch the order status from the order_tracking table
-def get_order_status(order_id):
-    connection = None
-    cursor = None
+    Returns:
+        int: The first ID of the reserved block, or -1 if there was an error
+    """
+    global order_sequence_ready
     try:
-        # Get a new connection if the global one is not available
-        connection = cnx if cnx and cnx.is_connected() else get_db_connection()
-        if not connection:
-            logger.error("Failed to get database connection")
+        with pool.connection() as connection:
+            if not connection:
+                logger.error("Failed to get database connection")
+                return -1
+
+            if not order_sequence_ready:
+                # Databases from before the sequence table (or from interactive_setup.py) lack it
+                connection.execute("create_order_sequence")
+
+            if connection.execute("advance_order_sequence", (count,)).rowcount == 0:
+                # The sequence row is missing: seed it from the existing orders
+                connection.execute("seed_order_sequence")
+                connection.execute("advance_order_sequence", (count,))
+
+            block_end = connection.execute("select_reserved_block_end").fetchall()[0][0]
+            connection.commit()
+            order_sequence_ready = True
+
+        block_start = block_end - count
+        logger.info("Reserved order IDs %s..%s", block_start, block_end - 1)
+        return block_start
+
+    except DatabaseError as err:
+        logger.error("Error reserving order IDs: %s", err)
+        return -1
+
+    except Exception as e:
+        logger.error("An unexpected error occurred: %s", e)
+        return -1
+
+
+class OrderIdAllocator:
+    """
+    Hands out order IDs from an in-memory block, refilling it from the database
+
+    Only one database round trip is made per ``block_size`` IDs. IDs left
+    over in a block when the process exits are skipped, never reused.
+    """
+
+    def __init__(self, reserve_block, block_size=ORDER_ID_BLOCK_SIZE):
+        self._reserve_block = reserve_block
+        self.block_size = block_size
+        self._next = 0
+        self._limit = 0
+        self._lock = threading.Lock()
+
+    def try_next_id(self):
+        """Return an ID from the current block without blocking, or None if a refill is needed"""
+        if not self._lock.acquire(blocking=False):
             return None
+        try:
+            if self._next < self._limit:
+                order_id = self._next
+                self._next += 1
+                return order_id
+            return None
+        finally:
+            self._lock.release()
+
+    def next_id(self):
+        with self._lock:
+            if self._next >= self._limit:
+                block_start = self._reserve_block(self.block_size)
+                if block_start == -1:
+                    return -1
+                self._next = block_start
+                self._limit = block_start + self.block_size
+            order_id = self._next
+            self._next += 1
+            return order_id
+
+
+order_id_allocator = OrderIdAllocator(reserve_order_id_block)
 
-        cursor = connection.cursor()
 
-        # Using parameterized query to prevent SQL injection
-        query = "SELECT status FROM order_tracking WHERE order_id = %s"
-        cursor.execute(query, (order_id,))
+# Function to get the next available order_id
+@metrics.db_function_latency.time()
+@tracing.traced()
+def get_next_order_id():
+    """
+    Allocate the next order ID
+
+    Returns:
+        int: A unique order ID, or -1 if no ID could be reserved
+    """
+    next_id = order_id_allocator.next_id()
+    if next_id != -1:
+        logger.info("Next order ID: %s", next_id)
+    return next_id
+
+# Function to fetch the order status, served from the status cache when possible
+@metrics.db_function_latency.time()
+@tracing.traced()
+def get_order_status(order_id, use_cache=True):
+    """
+    Args:
+        order_id: Order to look up
+        use_cache: Set to False to read the status from the database
+            (the result is still cached)
+    """
+    if use_cache:
+        cached = order_status_cache.get(order_id)
+        if cached is not MISSING:
+            return cached
+
+    try:
+        with pool.connection() as connection:
+            if not connection:
+                logger.error("Failed to get database connection")
+                return None
 
-        # Fetching the result
-        result = cursor.fetchone()
+            # Using parameterized query to prevent SQL injection
+            rows = connection.execute("select_order_status", (order_id,)).fetchall()
+            result = rows[0] if rows else None
 
         # Returning the order status
         if result:
-            logger.info(f"Status for order ID {order_id}: {result[0]}")
+            logger.info("Status for order ID %s: %s", order_id, result[0])
+            order_status_cache.set(order_id, result[0])
             return result[0]
         else:
-            logger.warning(f"No status found for order ID {order_id}")
+            logger.warning("No status found for order ID %s", order_id)
+            # Cache the miss briefly so repeated polling for a bad ID stays cheap
+            order_status_cache.set(order_id, None, ttl=ORDER_STATUS_NEGATIVE_TTL)
             return None
 
-    except mysql.connector.Error as err:
-        logger.error(f"Error getting order status: {err}")
+    except DatabaseError as err:
+        logger.error("Error getting order status: %s", err)
         return None
 
     except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
+        logger.error("An unexpected error occurred: %s", e)
         return None
 
-    finally:
-        # Closing the cursor
-        if cursor:
-            cursor.close()
+
+# Function to fetch the status of many orders at once
+@metrics.db_function_latency.time()
+@tracing.traced()
+def get_order_statuses(order_ids, use_cache=True):
+    """
+    Look up the status of many orders with chunked IN (...) queries
+
+    Cached statuses are served from the order status cache; only the
+    remaining IDs are queried, ORDER_STATUS_CHUNK_SIZE at a time.
+
+    Args:
+        order_ids: Iterable of order IDs
+        use_cache: Set to False to read every status from the database
+
+    Returns:
+        dict: Order ID to status (None for unknown orders), or None if there was an error
+    """
+    statuses = {}
+    missing = []
+    for order_id in dict.fromkeys(order_ids):
+        cached = order_status_cache.get(order_id) if use_cache else MISSING
+        if cached is MISSING:
+            missing.append(order_id)
+        else:
+            statuses[order_id] = cached
+
+    if not missing:
+        return statuses
+    cached_count = len(statuses)
+
+    try:
+        with pool.connection() as connection:
+            if not connection:
+                logger.error("Failed to get database connection")
+                return None
+
+            for start in range(0, len(missing), ORDER_STATUS_CHUNK_SIZE):
+                chunk = missing[start:start + ORDER_STATUS_CHUNK_SIZE]
+                # Pad to a bucket size by repeating the last ID so only a few
+                # distinct IN (...) statements ever need to be prepared
+                size = next(bucket for bucket in ORDER_STATUS_IN_BUCKETS if bucket >= len(chunk))
+                chunk += [chunk[-1]] * (size - len(chunk))
+                rows = connection.execute("select_order_statuses", chunk, size=size).fetchall()
+                for order_id, status in rows:
+                    statuses[order_id] = status
+                    order_status_cache.set(order_id, status)
+
+        for order_id in missing:
+            if order_id not in statuses:
+                statuses[order_id] = None
+                order_status_cache.set(order_id, None, ttl=ORDER_STATUS_NEGATIVE_TTL)
+
+        logger.info("Fetched status for %s orders (%s cached)", len(missing), cached_count)
+        return statuses
+
+    except DatabaseError as err:
+        logger.error("Error getting order statuses: %s", err)
+        return None
+
+    except Exception as e:
+        logger.error("An unexpected error occurred: %s", e)
+        return None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,292 @@
+"""
+Database connection pooling and prepared statement execution
+
+Shared by every storage backend: a backend supplies a connect() callable
+and a StatementRegistry holding the SQL for its dialect, and db_helper
+runs the same named statements against whichever pool is configured.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class StatementRegistry:
+    """
+    Named, parameterized SQL statements plus per-statement timing
+
+    Every query in this module is registered here once and executed as a
+    server-side prepared statement. Statements whose text depends on a row
+    or parameter count (multi-row INSERT, IN lists) are registered with a
+    builder and prepared once per size.
+    """
+
+    def __init__(self):
+        self._sql = {}
+        self._builders = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        # Callables(name, elapsed, failed) notified of every execution
+        self.observers = []
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def register(self, name, sql):
+        self._sql[name] = sql
+
+    def register_sized(self, name, builder):
+        self._builders[name] = builder
+
+    def resolve(self, name, size=None):
+        """Return (cache key, SQL text) for a statement"""
+        if size is None:
+            return name, self._sql[name]
+        key = f"{name}[{size}]"
+        sql = self._sql.get(key)
+        if sql is None:
+            sql = self._builders[name](size)
+            self._sql[key] = sql
+        return key, sql
+
+    def record(self, name, elapsed, failed=False):
+        with self._lock:
+            entry = self._stats.get(name)
+            if entry is None:
+                entry = self._stats[name] = [0, 0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += 1 if failed else 0
+            entry[2] += elapsed
+            entry[3] = max(entry[3], elapsed)
+        for observer in self.observers:
+            observer(name, elapsed, failed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    "calls": calls,
+                    "errors": errors,
+                    "avg_ms": round(total / calls * 1000, 3) if calls else 0.0,
+                    "max_ms": round(slowest * 1000, 3),
+                }
+                for name, (calls, errors, total, slowest) in self._stats.items()
+            }
+
+
+class _PooledConnection:
+    """A driver connection plus its prepared cursors and recycling bookkeeping"""
+
+    __slots__ = ("raw", "statements", "created_at", "idle_since", "_cursors")
+
+    def __init__(self, raw, statements):
+        self.raw = raw
+        self.statements = statements
+        self.created_at = time.monotonic()
+        self.idle_since = self.created_at
+        # One prepared cursor per statement; the server-side statement is
+        # prepared on first use and reused for the life of the connection
+        self._cursors = {}
+
+    def execute(self, name, params=(), size=None):
+        """
+        Execute a registered statement on this connection's prepared cursor
+
+        Returns:
+            The cursor, ready for fetchall() or rowcount
+        """
+        statements = self.statements
+        key, sql = statements.resolve(name, size)
+        cursor = self._cursors.get(key)
+        if cursor is None:
+            cursor = self._cursors[key] = self.raw.cursor(prepared=True)
+
+        started = time.perf_counter()
+        try:
+            cursor.execute(sql, params)
+        except Exception:
+            statements.record(name, time.perf_counter() - started, failed=True)
+            raise
+        statements.record(name, time.perf_counter() - started)
+        return cursor
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def is_connected(self):
+        return self.raw.is_connected()
+
+    def is_stale(self, recycle_after, ping_after=0):
+        """
+        Whether the connection should be replaced before it is handed out
+
+        Only connections idle longer than ``ping_after`` seconds are pinged;
+        a ping is a server round trip, and recently used ones are presumed alive.
+        """
+        now = time.monotonic()
+        if recycle_after > 0 and now - self.created_at > recycle_after:
+            return True
+        if now - self.idle_since < ping_after:
+            return False
+        try:
+            return not self.raw.is_connected()
+        except Exception:
+            return True
+
+    def close(self):
+        try:
+            self.raw.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Bounded pool of database connections
+
+    At most ``size`` connections exist at any time. Connections are opened
+    lazily, handed out LIFO so idle ones age out, and replaced when they are
+    older than ``recycle`` seconds or no longer connected. Liveness is only
+    checked for connections idle longer than ``ping_after`` seconds.
+    """
+
+    def __init__(self, connect, statements, size=5, timeout=5.0, recycle=1800, ping_after=30.0):
+        self._connect = connect
+        self.statements = statements
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._idle = []
+        self._open = 0
+        self._cond = threading.Condition()
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._connect_failures = 0
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    # Reserve the slot before connecting outside the lock
+                    self._open += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available within {self.timeout}s (pool size {self.size})"
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        if pooled is not None and pooled.is_stale(self.recycle, self.ping_after):
+            pooled.close()
+            pooled = None
+            with self._cond:
+                self._recycled += 1
+
+        if pooled is None:
+            try:
+                raw = self._connect()
+            except Exception:
+                raw = None
+            if not raw:
+                self._discard()
+                with self._cond:
+                    self._connect_failures += 1
+                return None
+            pooled = _PooledConnection(raw, self.statements)
+
+        with self._cond:
+            self._checkouts += 1
+        return pooled
+
+    def _release(self, pooled, broken=False):
+        if broken:
+            pooled.close()
+            self._discard()
+            return
+        pooled.idle_since = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    def _discard(self):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of a ``with`` block
+
+        Yields None when a connection cannot be established, so callers can
+        keep their existing "no connection" handling. Any uncommitted work is
+        rolled back on exit; connections that cannot be rolled back, or that
+        are found dead after an error, are closed instead of being returned
+        to the pool.
+        """
+        pooled = self._acquire()
+        if pooled is None:
+            yield None
+            return
+        failed = False
+        try:
+            yield pooled
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            broken = False
+            try:
+                # Never hand a connection with an open transaction to the next caller
+                if pooled.raw.in_transaction:
+                    pooled.raw.rollback()
+                # Recently used connections are not pinged at checkout, so check after errors
+                if failed and not pooled.is_connected():
+                    broken = True
+            except Exception:
+                broken = True
+            self._release(pooled, broken)
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            pooled.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+                "connect_failures": self._connect_failures,
+            }
@@ -1,16 +1,34 @@
 # Author: Dhaval Patel. Codebasics YouTube Channel
 
-import re
+import os
+from functools import lru_cache
+
+# Distinct session/context names whose extracted session ID is remembered
+SESSION_ID_CACHE_SIZE = int(os.getenv("SESSION_ID_CACHE_SIZE", 4096))
 
 def get_str_from_food_dict(food_dict: dict):
     result = ", ".join([f"{int(value)} {key}" for key, value in food_dict.items()])
     return result
 
 
+@lru_cache(maxsize=SESSION_ID_CACHE_SIZE)
 def extract_session_id(session_str: str):
-    match = re.search(r"/sessions/(.*?)/contexts/", session_str)
-    if match:
-        # Extract the actual session ID from the matched group
-        return match.group(1)
+    """
+    Extract the session ID from a Dialogflow session or context name
+
+    Accepts either the top-level ``session`` field
+    ("projects/p/agent/sessions/<id>") or an output context name
+    ("projects/p/agent/sessions/<id>/contexts/<name>"). Dialogflow repeats
+    the same names for every turn of a conversation, so results are memoized.
+
+    Returns:
+        str: The session ID, or "" if the string contains none
+    """
+    _, found, rest = session_str.partition("/sessions/")
+    if not found:
+        return ""
 
-    return ""
+    session_id, _, _ = rest.partition("/contexts/")
+    if "/" in session_id:
+        return ""
+    return session_id
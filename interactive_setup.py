@@ -156,6 +156,19 @@ def create_database_and_tables(host, user, password, database_name):
             )
         """)
         
+        # Create order ID sequence table used for atomic order ID allocation
+        print("Creating order_id_sequence table...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS order_id_sequence (
+                name VARCHAR(64) PRIMARY KEY,
+                next_id INT NOT NULL
+            )
+        """)
+        cursor.execute("""
+            INSERT IGNORE INTO order_id_sequence (name, next_id)
+            SELECT 'orders', IFNULL(MAX(order_id), 0) + 1 FROM orders
+        """)
+        
         # Insert sample food items
         print("Inserting sample food items...")
         sample_items = [
@@ -0,0 +1,52 @@
+"""
+JSON encoding and decoding for the webhook hot path
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise. Both paths produce compact UTF-8 output, so responses are
+byte-for-byte interchangeable apart from float formatting.
+"""
+
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson else "json"
+
+
+if orjson:
+    JSONDecodeError = orjson.JSONDecodeError
+
+    def loads(data) -> Any:
+        """Parse JSON from bytes or str"""
+        return orjson.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize to compact UTF-8 JSON bytes"""
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+else:
+    # json.loads raises UnicodeDecodeError, not JSONDecodeError, for bytes that are not UTF-8
+    JSONDecodeError = (json.JSONDecodeError, UnicodeDecodeError)
+
+    def loads(data) -> Any:
+        """Parse JSON from bytes or str"""
+        return json.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize to compact UTF-8 JSON bytes"""
+        return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """JSONResponse that renders with the fastest available codec"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
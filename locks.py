@@ -0,0 +1,96 @@
+"""
+Striped per-session locks
+
+Two webhook calls for the same session (Dialogflow retries, double clicks
+in the web UI) must not interleave their cart updates, e.g. an add landing
+between complete_order reading the cart and deleting it. A fixed set of
+locks is shared by hashing the session ID onto a stripe, so calls for
+different sessions almost never wait on each other and memory stays
+bounded no matter how many sessions exist.
+
+StripedAsyncLock serves coroutines on the event loop, StripedThreadLock
+serves code running on worker threads. Both record how long callers waited.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict
+
+# Number of lock stripes; a power of two well above the expected concurrency
+SESSION_LOCK_STRIPES = int(os.getenv("SESSION_LOCK_STRIPES", 256))
+
+
+class _LockStats:
+    """Acquisition counts and wait times shared by both lock variants"""
+
+    def __init__(self, stripes: int):
+        self.stripes = max(1, stripes)
+        self._stats_lock = threading.Lock()
+        self._acquired = 0
+        self._contended = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _stripe(self, key: str) -> int:
+        return hash(key) % self.stripes
+
+    def _record(self, waited: float, contended: bool) -> None:
+        with self._stats_lock:
+            self._acquired += 1
+            if contended:
+                self._contended += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "stripes": self.stripes,
+                "acquired": self._acquired,
+                "contended": self._contended,
+                "avg_wait_ms": round(self._wait_total / self._contended * 1000, 3) if self._contended else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+            }
+
+
+class StripedAsyncLock(_LockStats):
+    """asyncio locks striped by key, for handlers running on the event loop"""
+
+    def __init__(self, stripes: int = SESSION_LOCK_STRIPES):
+        super().__init__(stripes)
+        self._locks = [asyncio.Lock() for _ in range(self.stripes)]
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        """Hold the lock for ``key`` for the duration of the block"""
+        lock = self._locks[self._stripe(key)]
+        contended = lock.locked()
+        started = time.perf_counter()
+        async with lock:
+            self._record(time.perf_counter() - started, contended)
+            yield
+
+
+class StripedThreadLock(_LockStats):
+    """threading locks striped by key, for code running on worker threads"""
+
+    def __init__(self, stripes: int = SESSION_LOCK_STRIPES):
+        super().__init__(stripes)
+        self._locks = [threading.Lock() for _ in range(self.stripes)]
+
+    @contextmanager
+    def hold(self, key: str):
+        """Hold the lock for ``key`` for the duration of the block"""
+        lock = self._locks[self._stripe(key)]
+        contended = not lock.acquire(blocking=False)
+        started = time.perf_counter()
+        if contended:
+            lock.acquire()
+        self._record(time.perf_counter() - started, contended)
+        try:
+            yield
+        finally:
+            lock.release()
@@ -1,44 +1,55 @@
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import json
+import asyncio
 import os
+import sys
 import time
 from typing import Dict, Any, Callable, List
 from dotenv import load_dotenv
 from pathlib import Path
+from pydantic import BaseModel
 
 # Load environment variables first
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO')),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging: records are written by a background thread
+import logging_setup
+logging_setup.configure_logging()
 logger = logging.getLogger(__name__)
 
 # Import custom modules after logging is configured
 try:
     import db_helper
     import generic_helper
+    import json_codec
+    import async_db_helper
+    import menu
+    import order_journal
+    import metrics
+    import tracing
+    from cache import ResponseDeduper
+    from cart import Cart
+    from json_codec import FastJSONResponse
+    from locks import StripedAsyncLock
+    from router import IntentRouter
+    from session_store import create_session_store
+    from offload import db_executor, journal_executor, session_executor
     logger.info("Successfully imported custom modules")
 except ImportError as e:
-    logger.error(f"Failed to import custom modules: {e}")
+    logger.error("Failed to import custom modules: %s", e)
     raise
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Pandeyji Eatery API",
     description="API for Pandeyji Eatery chatbot with web interface",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # Set up templates and static files
@@ -57,8 +68,74 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# Dictionary to store in-progress orders
-inprogress_orders: Dict[str, Dict[str, int]] = {}
+# In-progress Carts keyed by interned session ID, with idle expiry;
+# SESSION_BACKEND=sqlite shares them between worker processes
+inprogress_orders = create_session_store(encode=Cart.to_bytes, decode=Cart.from_bytes)
+
+async def run_session_store(fn: Callable[..., Any], *args: Any) -> Any:
+    """Call a session store method, on a worker thread when the store can block"""
+    if inprogress_orders.blocking:
+        return await session_executor.run(fn, *args)
+    return fn(*args)
+
+# Serializes webhook calls for the same session so their cart updates cannot interleave
+session_locks = StripedAsyncLock()
+
+# Intent handlers register themselves below with @router.intent
+router = IntentRouter(observer=metrics.observe_intent)
+
+# Largest quantity of one food item accepted in a single order.add
+MAX_ITEM_QUANTITY = int(os.getenv("MAX_ITEM_QUANTITY", 100))
+
+# Maximum number of order IDs accepted by the bulk status endpoints
+MAX_STATUS_LOOKUP_IDS = 5000
+
+# Remembered webhook replies, and how many seconds a retry can still be answered from them
+WEBHOOK_DEDUPE_SIZE = int(os.getenv("WEBHOOK_DEDUPE_SIZE", 10000))
+WEBHOOK_DEDUPE_TTL = float(os.getenv("WEBHOOK_DEDUPE_TTL", 300))
+
+# Replies by (responseId, session), so retried deliveries never run handlers twice
+webhook_responses = ResponseDeduper(WEBHOOK_DEDUPE_SIZE, WEBHOOK_DEDUPE_TTL)
+
+# Maximum number of webhook requests accepted by /webhook/batch
+MAX_WEBHOOK_BATCH_SIZE = 1000
+
+# In-memory menu used to price orders without database reads
+menu_cache = menu.MenuCache(db_helper.fetch_food_items)
+
+def insert_journaled_orders(orders: List[tuple]) -> int:
+    """Write a batch of journaled orders, whose line totals are in cents"""
+    return db_helper.insert_orders([
+        (order_id, [(item_id, quantity, menu.cents_to_decimal(total_cents))
+                    for item_id, quantity, total_cents in lines], status)
+        for order_id, lines, status in orders
+    ])
+
+def find_existing_orders(order_ids: List[int]):
+    """Return the journaled order IDs that are already in the database"""
+    statuses = db_helper.get_order_statuses(order_ids, use_cache=False)
+    if statuses is None:
+        return None
+    return {order_id for order_id, status in statuses.items() if status is not None}
+
+# Write-behind checkout: orders are journaled locally and written to the database in the background
+order_writer = None
+if order_journal.ORDER_WRITE_BEHIND:
+    # Each worker process journals to its own slot and adopts slots left by dead workers
+    journal = order_journal.claim_journal(order_journal.ORDER_JOURNAL_PATH)
+    order_writer = order_journal.WriteBehindWriter(
+        journal,
+        insert_journaled_orders,
+        find_existing_orders
+    )
+    order_writer.start(order_journal.orphaned_journals(order_journal.ORDER_JOURNAL_PATH, journal.path))
+    logger.info("Write-behind checkout enabled with journal %s", journal.path)
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Flush journaled orders before the process exits"""
+    if order_writer:
+        await journal_executor.run(order_writer.stop)
 
 @app.get("/", response_class=HTMLResponse)
 async def web_interface(request: Request):
@@ -66,7 +143,7 @@ async def web_interface(request: Request):
     try:
         return templates.TemplateResponse("index.html", {"request": request})
     except Exception as e:
-        logger.error(f"Error serving web interface: {e}")
+        logger.error("Error serving web interface: %s", e)
         return HTMLResponse(content="""
         <html>
             <body style="font-family: Arial; text-align: center; padding: 50px;">
@@ -77,7 +154,7 @@ async def web_interface(request: Request):
         </html>
         """)
 
-@app.get("/api", response_class=JSONResponse)
+@app.get("/api", response_class=FastJSONResponse)
 async def api_status():
     """API status endpoint"""
     return {
@@ -87,25 +164,122 @@ async def api_status():
         "endpoints": {
             "web_interface": "GET /",
             "webhook": "POST /webhook", 
+            "webhook_batch": "POST /webhook/batch",
             "api_status": "GET /api",
             "docs": "GET /docs",
-            "health": "GET /health"
+            "health": "GET /health",
+            "menu_refresh": "POST /menu/refresh",
+            "order_status": "GET /orders/status?ids=1,2,3",
+            "order_status_bulk": "POST /orders/status",
+            "metrics": "GET /metrics",
+            "debug_traces": "GET /debug/traces?limit=20&name=intent%20order.complete&min_ms=100",
+            "debug_trace": "GET /debug/traces/{request_id}"
         }
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics in Prometheus text format"""
+    # Counting a shared SQLite store is a query, so it is read here rather than by a gauge callback
+    metrics.session_store_size.set(await run_session_store(len, inprogress_orders))
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/traces")
+async def get_traces(limit: int = 20, name: str = "", min_ms: float = 0):
+    """Recent sampled request traces, newest first, optionally filtered by span name or duration"""
+    return {"traces": tracing.tracer.recent(limit, name or None, min_ms), "tracing": tracing.tracer.stats()}
+
+@app.get("/debug/traces/{request_id}")
+async def get_trace(request_id: str):
+    """One sampled request trace by request ID"""
+    trace = tracing.tracer.get(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found; it was not sampled or has been evicted")
+    return trace
+
 @app.get("/health")
 async def health_check():
     """Detailed health check endpoint"""
     # Test database connection
-    db_status = "connected" if db_helper.cnx and db_helper.cnx.is_connected() else "disconnected"
-    
+    db_status = "connected" if await async_db_helper.is_connected() else "disconnected"
+    session_store_stats = await run_session_store(inprogress_orders.stats)
+
     return {
         "status": "healthy",
         "database": db_status,
-        "active_sessions": len(inprogress_orders),
+        "db_pool": db_helper.pool_stats(),
+        "db_statements": db_helper.statement_stats(),
+        "db_executor": db_executor.stats(),
+        "session_executor": session_executor.stats() if inprogress_orders.blocking else None,
+        "db_async_pool": async_db_helper.backend_stats(),
+        "order_status_cache": db_helper.order_status_cache_stats(),
+        "order_journal": order_writer.stats() if order_writer else None,
+        "active_sessions": session_store_stats["size"],
+        "session_store": session_store_stats,
+        "session_locks": session_locks.stats(),
+        "intents": router.stats(),
+        "webhook_dedupe": webhook_responses.stats(),
+        "tracing": tracing.tracer.stats(),
         "timestamp": time.time()
     }
 
+@app.post("/menu/refresh")
+async def refresh_menu():
+    """Reload the in-memory menu after food_items has changed"""
+    try:
+        current_menu = await db_executor.run(menu_cache.refresh)
+    except menu.MenuUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {
+        "version": current_menu.version,
+        "items": len(current_menu)
+    }
+
+class OrderStatusRequest(BaseModel):
+    ids: List[int]
+
+def lookup_order_statuses(order_ids: List[int]) -> dict:
+    """
+    Fetch the status of many orders for the bulk status endpoints
+
+    Args:
+        order_ids: Order IDs to look up
+
+    Returns:
+        dict: Response body mapping each order ID to its status (null if not found)
+    """
+    if not order_ids:
+        raise HTTPException(status_code=400, detail="No order IDs provided")
+    if len(order_ids) > MAX_STATUS_LOOKUP_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_STATUS_LOOKUP_IDS} order IDs per request")
+
+    statuses = db_helper.get_order_statuses(order_ids)
+    if statuses is None:
+        raise HTTPException(status_code=503, detail="Order status lookup failed")
+    if order_writer:
+        # Accepted orders the background writer has not reached yet
+        for order_id, status in statuses.items():
+            if status is None:
+                statuses[order_id] = order_writer.pending_status(order_id)
+
+    return {"statuses": {str(order_id): status for order_id, status in statuses.items()}}
+
+@app.get("/orders/status")
+async def get_order_statuses(ids: str):
+    """Bulk order status lookup, e.g. /orders/status?ids=41,42,43"""
+    try:
+        order_ids = [int(order_id) for order_id in ids.split(",") if order_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+
+    return await db_executor.run(lookup_order_statuses, order_ids)
+
+@app.post("/orders/status")
+async def post_order_statuses(body: OrderStatusRequest):
+    """Bulk order status lookup for lists too long for a query string"""
+    return await db_executor.run(lookup_order_statuses, body.ids)
+
 @app.post("/webhook")
 async def handle_request(request: Request):
     """
@@ -113,99 +287,211 @@ async def handle_request(request: Request):
 
     This function handles all incoming webhook requests from Dialogflow,
     extracts the intent and parameters, and routes to the appropriate handler.
+    The X-Request-ID header is echoed back, or generated when absent, and
+    names the request's trace if it is sampled.
     """
+    request_id = request.headers.get("x-request-id") or tracing.new_request_id()
+    headers = {"X-Request-ID": request_id}
     try:
         # Retrieve the JSON data from the request
-        payload = await request.json()
-        logger.info(f"Received webhook request: {payload.get('queryResult', {}).get('intent', {}).get('displayName', 'Unknown intent')}")
+        payload = json_codec.loads(await request.body())
+    except json_codec.JSONDecodeError as e:
+        logger.error("Invalid JSON in webhook request: %s", e)
+        return FastJSONResponse(content={
+            "fulfillmentText": "I'm sorry, but something went wrong. Please try again later."
+        }, headers=headers)
+
+    return FastJSONResponse(content=await process_webhook(payload, request_id), headers=headers)
+
+@app.post("/webhook/batch")
+async def handle_batch_request(request: Request):
+    """
+    Process many recorded Dialogflow webhook requests in one call
+
+    The body is a JSON array of WebhookRequests or newline-delimited JSON.
+    Requests for the same session run one after another in the order given;
+    different sessions run concurrently. Returns the fulfillment responses
+    in request order.
+    """
+    body = await request.body()
+    try:
+        if body.lstrip()[:1] == b"[":
+            payloads = json_codec.loads(body)
+        else:
+            payloads = [json_codec.loads(line) for line in body.splitlines() if line.strip()]
+    except json_codec.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+
+    if not payloads:
+        raise HTTPException(status_code=400, detail="No webhook requests provided")
+    if len(payloads) > MAX_WEBHOOK_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_WEBHOOK_BATCH_SIZE} webhook requests per batch")
+
+    # Group request indexes by session, keeping their order within each session
+    by_session: Dict[str, List[int]] = {}
+    for index, payload in enumerate(payloads):
+        session_name = get_session_name(payload) if isinstance(payload, dict) else ""
+        # Requests without a session cannot conflict with anything
+        key = generic_helper.extract_session_id(session_name) if session_name else f"#{index}"
+        by_session.setdefault(key or f"#{index}", []).append(index)
+
+    responses: List[Any] = [None] * len(payloads)
+    # Request n of the batch is traced as "<batch request ID>.<n>"
+    batch_id = request.headers.get("x-request-id") or tracing.new_request_id()
+
+    async def run_session(indexes: List[int]) -> None:
+        for index in indexes:
+            responses[index] = await process_webhook(payloads[index], f"{batch_id}.{index}")
+
+    await asyncio.gather(*(run_session(indexes) for indexes in by_session.values()))
+    logger.info("Processed webhook batch of %s requests across %s sessions", len(payloads), len(by_session))
+    return responses
+
+def get_session_name(payload: dict) -> str:
+    """Return the Dialogflow session name of a webhook request, or "" if it has none"""
+    # Prefer the top-level session name; older payloads only carry it in the contexts
+    output_contexts = payload.get('queryResult', {}).get('outputContexts', [])
+    return payload.get('session') or (output_contexts[0].get("name", "") if output_contexts else "")
+
+async def process_webhook(payload: Any, request_id: str = None) -> dict:
+    """
+    Handle one Dialogflow webhook request, answering retries from the dedupe cache
+
+    Dialogflow retries a slow webhook with the same responseId. Replaying the
+    first reply keeps a retried order.add from adding items twice and a
+    retried order.complete from placing a second order.
+
+    Args:
+        payload: Parsed WebhookRequest
+        request_id: ID the request is traced under if it is sampled
+
+    Returns:
+        dict: Response body to send back to Dialogflow
+    """
+    with tracing.tracer.trace("webhook", request_id):
+        response_id = payload.get('responseId') if isinstance(payload, dict) else None
+        if not response_id:
+            return await route_webhook(payload)
+        tracing.set_attribute("response_id", response_id)
+        return await webhook_responses.run((response_id, get_session_name(payload)),
+                                           lambda: route_webhook(payload))
+
+async def route_webhook(payload: Any) -> dict:
+    """
+    Route one Dialogflow webhook request to its intent handler
 
+    Args:
+        payload: Parsed WebhookRequest
+
+    Returns:
+        dict: Response body to send back to Dialogflow
+    """
+    intent = ''
+    try:
         # Extract the necessary information from the payload
         # based on the structure of the WebhookRequest from Dialogflow
         query_result = payload.get('queryResult', {})
         intent = query_result.get('intent', {}).get('displayName', '')
         parameters = query_result.get('parameters', {})
-        output_contexts = query_result.get('outputContexts', [])
+        logger.info("Received webhook request: %s", intent or 'Unknown intent')
 
-        if not output_contexts:
-            logger.error("No output contexts found in the request")
-            return JSONResponse(content={
+        session_name = get_session_name(payload)
+        if not session_name:
+            logger.error("No session or output contexts found in the request")
+            return {
                 "fulfillmentText": "I'm sorry, but I couldn't process your request. Please try again."
-            })
+            }
 
-        session_id = generic_helper.extract_session_id(output_contexts[0]["name"])
+        session_id = generic_helper.extract_session_id(session_name)
+        tracing.set_attribute("intent", intent)
+        tracing.set_attribute("session_id", session_id)
+        if session_id:
+            # Every request of a session then shares one key string in the session store
+            session_id = sys.intern(session_id)
 
         if not session_id:
             logger.error("Failed to extract session ID from context")
-            return JSONResponse(content={
+            return {
                 "fulfillmentText": "I'm sorry, but I couldn't identify your session. Please try again."
-            })
-
-        # Map intents to their handler functions
-        intent_handler_dict = {
-            'order.add - context: ongoing-order': add_to_order,
-            'order.remove - context: ongoing-order': remove_from_order,
-            'order.complete - context: ongoing-order': complete_order,
-            'track.order - context: ongoing-tracking': track_order
-        }
+            }
 
         # Check if the intent is supported
-        if intent not in intent_handler_dict:
-            logger.warning(f"Unsupported intent: {intent}")
-            return JSONResponse(content={
+        route = router.resolve(intent)
+        if route is None:
+            logger.warning("Unsupported intent: %s", intent)
+            metrics.webhook_unsupported_intents.inc()
+            return {
                 "fulfillmentText": "I'm sorry, I don't know how to process that request. Can you try something else?"
-            })
+            }
 
-        # Call the appropriate handler function
-        logger.info(f"Routing to handler for intent: {intent}")
-        return intent_handler_dict[intent](parameters, session_id)
+        # Call the appropriate handler function; handlers await their
+        # database calls, so blocking I/O never stalls the event loop
+        logger.info("Routing to handler for intent: %s", intent)
+        if route.locks_session:
+            # A retry or double click for this session waits until this call has finished
+            async with session_locks.hold(session_id):
+                return await router.dispatch(route, parameters, session_id)
+        return await router.dispatch(route, parameters, session_id)
 
     except Exception as e:
-        logger.error(f"Error processing webhook request: {str(e)}", exc_info=True)
-        return JSONResponse(content={
+        logger.error("Error processing webhook request: %s", e, exc_info=True)
+        metrics.webhook_errors.inc(intent or "unknown")
+        return {
             "fulfillmentText": "I'm sorry, but something went wrong. Please try again later."
-        })
+        }
 
-def save_to_db(order: dict) -> int:
+@metrics.save_to_db_latency.time()
+@tracing.traced()
+async def save_to_db(priced_order: menu.PricedOrder) -> int:
     """
     Save the order to the database
 
     Args:
-        order: Dictionary with food items as keys and quantities as values
+        priced_order: Order with every line resolved against the menu
 
     Returns:
         int: The order ID if successful, -1 if there was an error
     """
     try:
+        if not priced_order.lines:
+            # An order without lines cannot be inserted, and would block the write-behind journal
+            logger.error("Refusing to save an empty order")
+            return -1
+
         # Get the next available order ID
-        next_order_id = db_helper.get_next_order_id()
-        logger.info(f"Saving order with ID {next_order_id}: {order}")
-
-        # Insert individual items along with quantity in orders table
-        for food_item, quantity in order.items():
-            rcode = db_helper.insert_order_item(
-                food_item,
-                quantity,
-                next_order_id
-            )
-
-            if rcode == -1:
-                logger.error(f"Failed to insert order item: {food_item}, quantity: {quantity}")
-                return -1
-
-        # Now insert order tracking status
-        result = db_helper.insert_order_tracking(next_order_id, "in progress")
+        next_order_id = await async_db_helper.get_next_order_id()
+        if next_order_id == -1:
+            logger.error("Failed to allocate an order ID")
+            return -1
+        logger.info("Saving order with ID %s: %s", next_order_id, priced_order.lines)
+
+        if order_writer:
+            # Durably journal the order and reply now; the database write happens in the background
+            journal_lines = [(line.item_id, line.quantity, line.total_cents) for line in priced_order.lines]
+            await journal_executor.run(order_writer.submit, next_order_id, journal_lines, "in progress")
+            db_helper.order_status_cache.set(next_order_id, "in progress")
+            logger.info("Order %s accepted into journal", next_order_id)
+            return next_order_id
+
+        # Insert all items and the tracking status in one transaction
+        lines = [
+            (line.item_id, line.quantity, menu.cents_to_decimal(line.total_cents))
+            for line in priced_order.lines
+        ]
+        result = await async_db_helper.insert_order(next_order_id, lines, "in progress")
         if result == -1:
-            logger.error(f"Failed to insert order tracking for order ID: {next_order_id}")
+            logger.error("Failed to insert order ID: %s", next_order_id)
             return -1
 
-        logger.info(f"Order {next_order_id} saved successfully")
+        logger.info("Order %s saved successfully", next_order_id)
         return next_order_id
 
     except Exception as e:
-        logger.error(f"Error saving order to database: {str(e)}", exc_info=True)
+        logger.error("Error saving order to database: %s", e, exc_info=True)
         return -1
 
-def complete_order(parameters: dict, session_id: str) -> JSONResponse:
+@router.intent("order.complete", locks_session=True)
+async def complete_order(parameters: dict, session_id: str) -> dict:
     """
     Complete the current order and save it to the database
 
@@ -214,45 +500,71 @@ def complete_order(parameters: dict, session_id: str) -> JSONResponse:
         session_id: Session ID from Dialogflow
 
     Returns:
-        JSONResponse: Response to send back to Dialogflow
+        dict: Response body to send back to Dialogflow
     """
-    logger.info(f"Completing order for session {session_id}")
+    logger.info("Completing order for session %s", session_id)
 
-    if session_id not in inprogress_orders:
-        logger.warning(f"No in-progress order found for session {session_id}")
+    try:
+        # Load the menu before claiming the cart, so a menu outage leaves the cart in place
+        current_menu = menu_cache.peek() or await db_executor.run(menu_cache.get)
+    except menu.MenuUnavailableError as e:
+        logger.error("Menu unavailable while completing order: %s", e)
+        return {
+            "fulfillmentText": "Sorry, I couldn't load our menu right now. Please try completing your order again."
+        }
+
+    # Claim the cart with an atomic pop before saving it: an order.add handled
+    # by another worker meanwhile starts a new cart instead of being lost, and
+    # a retried order.complete finds nothing left to place a second time
+    order = await run_session_store(inprogress_orders.pop, session_id)
+    if order is None:
+        logger.warning("No in-progress order found for session %s", session_id)
         fulfillment_text = "I'm having a trouble finding your order. Sorry! Can you place a new order please?"
+    elif len(order) == 0:
+        # Every item was removed again; there is nothing to place
+        logger.warning("In-progress order for session %s is empty", session_id)
+        fulfillment_text = "Your order is empty! Please add some items before completing your order."
     else:
         try:
-            order = inprogress_orders[session_id]
-            logger.info(f"Found in-progress order for session {session_id}: {order}")
+            logger.info("Claimed in-progress order for session %s: %s", session_id, order)
 
-            order_id = save_to_db(order)
+            try:
+                # Price the order in memory; totals no longer need a database read
+                if order.menu_version != current_menu.version:
+                    logger.info("Menu changed since order for session %s was started; repricing", session_id)
+                priced_order = current_menu.price_cart(order)
+            except menu.UnknownItemError as e:
+                logger.warning("Order for session %s has items not on the menu: %s", session_id, e.names)
+                priced_order = None
+                fulfillment_text = f"Sorry, we don't have {', '.join(e.names)} on our menu. " \
+                                "Please place a new order again"
+
+            order_id = await save_to_db(priced_order) if priced_order else None
             if order_id == -1:
-                logger.error(f"Failed to save order to database for session {session_id}")
+                logger.error("Failed to save order to database for session %s", session_id)
+                metrics.save_to_db_failures.inc()
                 fulfillment_text = "Sorry, I couldn't process your order due to a backend error. " \
                                 "Please place a new order again"
-            else:
-                order_total = db_helper.get_total_order_price(order_id)
-                logger.info(f"Order {order_id} completed successfully with total: {order_total}")
+            elif order_id is not None:
+                order_total = menu.format_cents(priced_order.total_cents)
+                logger.info("Order %s completed successfully with total: %s", order_id, order_total)
 
                 fulfillment_text = f"Awesome. We have placed your order. " \
                             f"Here is your order id # {order_id}. " \
-                            f"Your order total is ${order_total:.2f} which you can pay at the time of delivery!"
-
-            # Remove the order from in-progress orders
-            del inprogress_orders[session_id]
-            logger.info(f"Removed in-progress order for session {session_id}")
+                            f"Your order total is ${order_total} which you can pay at the time of delivery!"
 
         except Exception as e:
-            logger.error(f"Error completing order: {str(e)}", exc_info=True)
+            logger.error("Error completing order: %s", e, exc_info=True)
+            metrics.webhook_errors.inc("order.complete")
             fulfillment_text = "Sorry, something went wrong while processing your order. Please try again."
 
-    return JSONResponse(content={
+    return {
         "fulfillmentText": fulfillment_text
-    })
+    }
 
 
-def add_to_order(parameters: dict, session_id: str) -> JSONResponse:
+@router.intent("order.add", locks_session=True)
+async def add_to_order(parameters: dict, session_id: str) -> dict:
     """
     Add items to the current order
 
@@ -261,16 +573,16 @@ def add_to_order(parameters: dict, session_id: str) -> JSONResponse:
         session_id: Session ID from Dialogflow
 
     Returns:
-        JSONResponse: Response to send back to Dialogflow
+        dict: Response body to send back to Dialogflow
     """
     try:
-        logger.info(f"Adding items to order for session {session_id}")
+        logger.info("Adding items to order for session %s", session_id)
 
         # Extract food items and quantities from parameters
         food_items = parameters.get("food-item", [])
         quantities = parameters.get("number", [])
 
-        logger.info(f"Food items: {food_items}, Quantities: {quantities}")
+        logger.info("Food items: %s, Quantities: %s", food_items, quantities)
 
         # Validate input parameters
         if not food_items:
@@ -280,7 +592,7 @@ def add_to_order(parameters: dict, session_id: str) -> JSONResponse:
             logger.warning("No quantities specified")
             fulfillment_text = "Please specify the quantities for your food items."
         elif len(food_items) != len(quantities):
-            logger.warning(f"Mismatch between food items and quantities: {len(food_items)} items, {len(quantities)} quantities")
+            logger.warning("Mismatch between food items and quantities: %s items, %s quantities", len(food_items), len(quantities))
             fulfillment_text = "Sorry, the number of food items and quantities don't match. Please specify both items and their quantities clearly."
         else:
             # Validate quantities are positive numbers
@@ -291,40 +603,70 @@ def add_to_order(parameters: dict, session_id: str) -> JSONResponse:
                         validated_quantities.append(int(qty))
                     else:
                         raise ValueError(f"Invalid quantity: {qty}")
-
-                # Create a dictionary of food items and quantities
-                new_food_dict = dict(zip(food_items, validated_quantities))
-
-                # Update the in-progress order
-                if session_id in inprogress_orders:
-                    logger.info(f"Updating existing order for session {session_id}")
-                    current_food_dict = inprogress_orders[session_id]
-                    # Update quantities (add to existing or create new)
-                    for item, qty in new_food_dict.items():
-                        current_food_dict[item] = current_food_dict.get(item, 0) + qty
-                    inprogress_orders[session_id] = current_food_dict
+                too_large = any(qty > MAX_ITEM_QUANTITY for qty in validated_quantities)
+
+                # Resolve food names to menu items before touching the cart
+                current_menu = menu_cache.peek() or await db_executor.run(menu_cache.get)
+                new_items = []
+                unknown_items = []
+                for food_item, qty in zip(food_items, validated_quantities):
+                    item = current_menu.get(food_item)
+                    if item is None:
+                        unknown_items.append(food_item)
+                    else:
+                        new_items.append((item, qty))
+
+                if too_large:
+                    logger.warning("Quantity above %s requested for session %s: %s", MAX_ITEM_QUANTITY, session_id, quantities)
+                    fulfillment_text = f"Sorry, you can order at most {MAX_ITEM_QUANTITY} of each item at a time. " \
+                                    "Please try a smaller quantity."
+                elif unknown_items:
+                    logger.warning("Items not on the menu for session %s: %s", session_id, unknown_items)
+                    fulfillment_text = f"Sorry, we don't have {', '.join(unknown_items)} on our menu. " \
+                                    "Please choose something else from the menu."
                 else:
-                    logger.info(f"Creating new order for session {session_id}")
-                    inprogress_orders[session_id] = new_food_dict
-
-                # Generate a string representation of the order
-                order_str = generic_helper.get_str_from_food_dict(inprogress_orders[session_id])
-                fulfillment_text = f"Great! I've added that to your order. So far you have: {order_str}. Would you like to add anything else?"
+                    # Update the in-progress order
+                    def merge_items(cart):
+                        if cart is None:
+                            logger.info("Creating new order for session %s", session_id)
+                            cart = Cart(current_menu.version)
+                        else:
+                            logger.info("Updating existing order for session %s", session_id)
+                            # Edit a copy so a failed add leaves the stored cart untouched
+                            cart = cart.copy()
+                            if cart.menu_version != current_menu.version:
+                                cart.reprice(current_menu)
+                        # Add to existing quantities or create new lines
+                        for item, qty in new_items:
+                            cart.add(item, qty)
+                        return cart
+
+                    # Atomic read-modify-write, safe even when workers share the session store
+                    cart = await run_session_store(inprogress_orders.update, session_id, merge_items)
+
+                    order_str = cart.summary(current_menu)
+                    fulfillment_text = f"Great! I've added that to your order. So far you have: {order_str}. Would you like to add anything else?"
 
             except ValueError as ve:
-                logger.error(f"Invalid quantity value: {ve}")
+                logger.error("Invalid quantity value: %s", ve)
                 fulfillment_text = "Please provide valid quantities (positive numbers) for your food items."
 
+    except menu.MenuUnavailableError as e:
+        logger.error("Menu unavailable while adding to order: %s", e)
+        fulfillment_text = "Sorry, I couldn't load our menu right now. Please try again."
+
     except Exception as e:
-        logger.error(f"Error adding to order: {str(e)}", exc_info=True)
+        logger.error("Error adding to order: %s", e, exc_info=True)
+        metrics.webhook_errors.inc("order.add")
         fulfillment_text = "Sorry, something went wrong while adding items to your order. Please try again."
 
-    return JSONResponse(content={
+    return {
         "fulfillmentText": fulfillment_text
-    })
+    }
 
 
-def remove_from_order(parameters: dict, session_id: str) -> JSONResponse:
+@router.intent("order.remove", locks_session=True)
+async def remove_from_order(parameters: dict, session_id: str) -> dict:
     """
     Remove items from the current order
 
@@ -333,34 +675,45 @@ def remove_from_order(parameters: dict, session_id: str) -> JSONResponse:
         session_id: Session ID from Dialogflow
 
     Returns:
-        JSONResponse: Response to send back to Dialogflow
+        dict: Response body to send back to Dialogflow
     """
     try:
-        logger.info(f"Removing items from order for session {session_id}")
-
-        if session_id not in inprogress_orders:
-            logger.warning(f"No in-progress order found for session {session_id}")
-            return JSONResponse(content={
-                "fulfillmentText": "I'm having a trouble finding your order. Sorry! Can you place a new order please?"
-            })
+        logger.info("Removing items from order for session %s", session_id)
 
         # Extract food items from parameters
         food_items = parameters.get("food-item", [])
-        logger.info(f"Food items to remove: {food_items}")
-
-        current_order = inprogress_orders[session_id]
-        logger.info(f"Current order: {current_order}")
+        logger.info("Food items to remove: %s", food_items)
 
+        # Resolve food names to menu items before touching the cart
+        current_menu = menu_cache.peek() or await db_executor.run(menu_cache.get)
+        resolved_items = [(food_item, current_menu.get(food_item)) for food_item in food_items]
         removed_items = []
         no_such_items = []
 
-        # Remove items from the order
-        for item in food_items:
-            if item not in current_order:
-                no_such_items.append(item)
-            else:
-                removed_items.append(item)
-                del current_order[item]
+        def remove_items(cart):
+            if cart is None:
+                return None
+            logger.info("Current order: %s", cart)
+            # Edit a copy so the stored cart only changes through update's write
+            cart = cart.copy()
+            if cart.menu_version != current_menu.version:
+                # The total was built with older prices; removing at today's would skew it
+                cart.reprice(current_menu)
+
+            # Remove items from the order
+            for food_item, item in resolved_items:
+                if item is not None and cart.remove(item):
+                    removed_items.append(item.name)
+                else:
+                    no_such_items.append(food_item)
+            return cart
+
+        cart = await run_session_store(inprogress_orders.update, session_id, remove_items)
+        if cart is None:
+            logger.warning("No in-progress order found for session %s", session_id)
+            return {
+                "fulfillmentText": "I'm having a trouble finding your order. Sorry! Can you place a new order please?"
+            }
 
         # Generate response based on what was removed
         if len(removed_items) > 0:
@@ -371,24 +724,30 @@ def remove_from_order(parameters: dict, session_id: str) -> JSONResponse:
         if len(no_such_items) > 0:
             fulfillment_text += f' Your current order does not have {", ".join(no_such_items)}.'
 
-        if len(current_order.keys()) == 0:
+        if len(cart) == 0:
             fulfillment_text += " Your order is empty!"
         else:
-            order_str = generic_helper.get_str_from_food_dict(current_order)
+            order_str = cart.summary(current_menu)
             fulfillment_text += f" Here is what is left in your order: {order_str}"
 
-        logger.info(f"Updated order: {current_order}")
+        logger.info("Updated order: %s", cart)
+
+    except menu.MenuUnavailableError as e:
+        logger.error("Menu unavailable while removing from order: %s", e)
+        fulfillment_text = "Sorry, I couldn't load our menu right now. Please try again."
 
     except Exception as e:
-        logger.error(f"Error removing from order: {str(e)}", exc_info=True)
+        logger.error("Error removing from order: %s", e, exc_info=True)
+        metrics.webhook_errors.inc("order.remove")
         fulfillment_text = "Sorry, something went wrong while removing items from your order. Please try again."
 
-    return JSONResponse(content={
+    return {
         "fulfillmentText": fulfillment_text
-    })
+    }
 
 
-def track_order(parameters: dict, session_id: str) -> JSONResponse:
+@router.intent("track.order")
+async def track_order(parameters: dict, session_id: str) -> dict:
     """
     Track the status of an order
 
@@ -397,37 +756,41 @@ def track_order(parameters: dict, session_id: str) -> JSONResponse:
         session_id: Session ID from Dialogflow
 
     Returns:
-        JSONResponse: Response to send back to Dialogflow
+        dict: Response body to send back to Dialogflow
     """
     try:
         # Extract order ID from parameters
         order_id = int(parameters.get('order_id', 0))
-        logger.info(f"Tracking order {order_id}")
+        logger.info("Tracking order %s", order_id)
 
         if order_id <= 0:
-            logger.warning(f"Invalid order ID: {order_id}")
-            return JSONResponse(content={
+            logger.warning("Invalid order ID: %s", order_id)
+            return {
                 "fulfillmentText": "Please provide a valid order ID to track your order."
-            })
+            }
 
-        # Get the order status from the database
-        order_status = db_helper.get_order_status(order_id)
+        # Orders still waiting in the write-behind journal are not in the database yet
+        order_status = order_writer.pending_status(order_id) if order_writer else None
+        if order_status is None:
+            # Get the order status from the database
+            order_status = await async_db_helper.get_order_status(order_id)
 
         if order_status:
-            logger.info(f"Order {order_id} status: {order_status}")
+            logger.info("Order %s status: %s", order_id, order_status)
             fulfillment_text = f"The order status for order id: {order_id} is: {order_status}"
         else:
-            logger.warning(f"No order found with ID: {order_id}")
+            logger.warning("No order found with ID: %s", order_id)
             fulfillment_text = f"No order found with order id: {order_id}"
 
     except ValueError:
-        logger.error(f"Invalid order ID format: {parameters.get('order_id', '')}")
+        logger.error("Invalid order ID format: %s", parameters.get('order_id', ''))
         fulfillment_text = "Please provide a valid order ID number."
 
     except Exception as e:
-        logger.error(f"Error tracking order: {str(e)}", exc_info=True)
+        logger.error("Error tracking order: %s", e, exc_info=True)
+        metrics.webhook_errors.inc("track.order")
         fulfillment_text = "Sorry, something went wrong while tracking your order. Please try again."
 
-    return JSONResponse(content={
+    return {
         "fulfillmentText": fulfillment_text
-    })
\ No newline at end of file
+    }
\ No newline at end of file
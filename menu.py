@@ -0,0 +1,310 @@
+"""
+In-memory menu cache for Pandeyji Eatery
+
+The food_items table is loaded once into an immutable, versioned Menu.
+Prices are kept as integer cents so order totals can be computed in Python
+without rounding drift and without another database round trip.
+
+Each Menu also carries a name resolver for the food-item strings Dialogflow
+sends: names are matched after case, punctuation and plural folding, and
+anything still unmatched falls back to a trigram similarity search.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the menu is reloaded from the database
+MENU_REFRESH_SECONDS = float(os.getenv("MENU_REFRESH_SECONDS", 300))
+# Seconds before a failed menu reload is retried
+MENU_RETRY_SECONDS = float(os.getenv("MENU_RETRY_SECONDS", 5))
+# Minimum trigram similarity (0-1) for a fuzzy food name match
+MENU_FUZZY_THRESHOLD = float(os.getenv("MENU_FUZZY_THRESHOLD", 0.5))
+# Fuzzy lookups remembered per menu version
+MENU_FUZZY_MEMO_SIZE = 1024
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+class MenuItem(NamedTuple):
+    item_id: int
+    name: str
+    price_cents: int
+
+
+class OrderLine(NamedTuple):
+    item_id: int
+    name: str
+    quantity: int
+    total_cents: int
+
+
+class PricedOrder(NamedTuple):
+    lines: Tuple[OrderLine, ...]
+    total_cents: int
+    menu_version: int
+
+
+class UnknownItemError(KeyError):
+    """Raised when an order contains food items that are not on the menu"""
+
+    def __init__(self, names: List[str]):
+        super().__init__(names)
+        self.names = names
+
+
+class MenuUnavailableError(RuntimeError):
+    """Raised when the menu has never been loaded successfully"""
+
+
+def to_cents(price) -> int:
+    """Convert a DECIMAL/float/str price to integer cents"""
+    return int((Decimal(str(price)) * 100).to_integral_value())
+
+
+def format_cents(cents: int) -> str:
+    """Format integer cents as a dollar amount, e.g. 2350 -> '23.50'"""
+    return f"{cents // 100}.{cents % 100:02d}"
+
+
+def cents_to_decimal(cents: int) -> Decimal:
+    """Convert integer cents to a DECIMAL(10, 2) compatible value"""
+    return Decimal(cents).scaleb(-2)
+
+
+def _name_key(name: str) -> str:
+    # food_items.name uses a case-insensitive collation, mirror that here
+    return name.strip().casefold()
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
+
+
+def normalize_name(name: str) -> str:
+    """Fold case, punctuation and plurals, e.g. 'Masala-Dosas ' -> 'masala dosa'"""
+    words = _NON_ALNUM.split(name.casefold())
+    return " ".join(_singular(word) for word in words if word)
+
+
+def _trigrams(normalized: str) -> frozenset:
+    padded = f"  {normalized} "
+    return frozenset(padded[index:index + 3] for index in range(len(padded) - 2))
+
+
+class Menu:
+    """Immutable snapshot of the food_items table"""
+
+    __slots__ = ("version", "items", "_by_name", "_by_id", "_aliases", "_trigram_index", "_fuzzy_memo")
+
+    def __init__(self, items: Iterable[MenuItem], version: int):
+        self.version = version
+        self.items = tuple(items)
+        self._by_name = MappingProxyType({_name_key(item.name): item for item in self.items})
+        self._by_id = MappingProxyType({item.item_id: item for item in self.items})
+
+        # Normalized names and their space-free spellings ("pavbhaji")
+        aliases = {}
+        trigram_index: Dict[str, List[Tuple[MenuItem, int]]] = {}
+        for item in self.items:
+            normalized = normalize_name(item.name)
+            aliases.setdefault(normalized, item)
+            aliases.setdefault(normalized.replace(" ", ""), item)
+            trigrams = _trigrams(normalized)
+            for trigram in trigrams:
+                trigram_index.setdefault(trigram, []).append((item, len(trigrams)))
+        self._aliases = MappingProxyType(aliases)
+        self._trigram_index = MappingProxyType(trigram_index)
+        self._fuzzy_memo: Dict[str, Optional[MenuItem]] = {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def get(self, name: str) -> Optional[MenuItem]:
+        """
+        Resolve a food name as said by the customer to a menu item
+
+        Tries the exact (case-insensitive) name, then the name with case,
+        punctuation and plurals folded, then the closest name by trigram
+        similarity. Returns None if nothing is close enough.
+        """
+        item = self._by_name.get(_name_key(name))
+        if item is not None:
+            return item
+
+        normalized = normalize_name(name)
+        item = self._aliases.get(normalized) or self._aliases.get(normalized.replace(" ", ""))
+        if item is not None or not normalized:
+            return item
+
+        try:
+            return self._fuzzy_memo[normalized]
+        except KeyError:
+            pass
+        item = self._fuzzy_match(normalized)
+        if len(self._fuzzy_memo) >= MENU_FUZZY_MEMO_SIZE:
+            self._fuzzy_memo.clear()
+        self._fuzzy_memo[normalized] = item
+        if item is not None:
+            logger.info("Matched food name %r to %r", name, item.name)
+        return item
+
+    def _fuzzy_match(self, normalized: str) -> Optional[MenuItem]:
+        query = _trigrams(normalized)
+        shared: Dict[MenuItem, List[int]] = {}
+        for trigram in query:
+            for item, size in self._trigram_index.get(trigram, ()):
+                counts = shared.setdefault(item, [0, size])
+                counts[0] += 1
+
+        best = None
+        best_score = 0.0
+        tied = False
+        for item, (common, size) in shared.items():
+            # Jaccard similarity of the two trigram sets
+            score = common / (len(query) + size - common)
+            if score > best_score:
+                best, best_score, tied = item, score, False
+            elif score == best_score:
+                tied = True
+
+        if best is None or tied or best_score < MENU_FUZZY_THRESHOLD:
+            return None
+        return best
+
+    def get_by_id(self, item_id: int) -> Optional[MenuItem]:
+        return self._by_id.get(item_id)
+
+    def price_cart(self, cart) -> PricedOrder:
+        """
+        Build order lines for a Cart of item IDs
+
+        Lines are always priced against this menu, so a cart whose running
+        total was computed against an older menu version is charged current prices.
+
+        Raises:
+            UnknownItemError: If an item has been taken off the menu since it was added
+        """
+        lines = []
+        unknown = []
+        total_cents = 0
+        for item_id, quantity in cart:
+            item = self._by_id.get(item_id)
+            if item is None:
+                unknown.append(f"item #{item_id}")
+                continue
+            line_total = item.price_cents * quantity
+            lines.append(OrderLine(item_id, item.name, quantity, line_total))
+            total_cents += line_total
+
+        if unknown:
+            raise UnknownItemError(unknown)
+        return PricedOrder(tuple(lines), total_cents, self.version)
+
+
+def menu_version(items: Iterable[MenuItem]) -> int:
+    """
+    Version number for a menu's contents, the same in every process
+
+    A CRC-32 of the items, so it fits the cart's uint32 header; 0 is kept
+    for "no menu".
+    """
+    data = "\n".join(f"{item.item_id}\t{item.name}\t{item.price_cents}" for item in items)
+    return zlib.crc32(data.encode("utf-8")) or 1
+
+
+class MenuCache:
+    """
+    Holds the current Menu and reloads it when it expires or is invalidated
+
+    The loader returns rows of (item_id, name, price) or None on failure.
+    If a reload fails the previous menu keeps being served, and the reload
+    is not retried for ``retry_seconds``. The version is
+    derived from the menu contents, so every worker process agrees on it and
+    it only changes when the loaded contents actually differ.
+    """
+
+    def __init__(self, loader: Callable[[], Optional[List[tuple]]], refresh_seconds: float = MENU_REFRESH_SECONDS,
+                 retry_seconds: float = MENU_RETRY_SECONDS):
+        self._loader = loader
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = retry_seconds
+        self._menu: Optional[Menu] = None
+        self._loaded_at = 0.0
+        # Monotonic time before which a failed reload is not retried
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def _reload_due(self, now: float) -> bool:
+        if now < self._retry_at:
+            return False
+        return self._menu is None or now - self._loaded_at >= self.refresh_seconds
+
+    def get(self) -> Menu:
+        """
+        Return the current menu, loading it first if needed
+
+        Raises:
+            MenuUnavailableError: If the menu has never been loaded
+        """
+        menu = self._menu
+        if menu is not None and not self._reload_due(time.monotonic()):
+            return menu
+
+        with self._lock:
+            # Another thread may have refreshed it, or failed to, while we waited
+            if self._reload_due(time.monotonic()):
+                self._reload()
+            if self._menu is None:
+                raise MenuUnavailableError("Menu could not be loaded from the database")
+            return self._menu
+
+    def peek(self) -> Optional[Menu]:
+        """Return the current menu unless a reload is due, without ever loading"""
+        menu = self._menu
+        if menu is not None and not self._reload_due(time.monotonic()):
+            return menu
+        return None
+
+    def invalidate(self) -> None:
+        """Force the next get() to reload the menu"""
+        self._loaded_at = 0.0
+        self._retry_at = 0.0
+
+    def refresh(self) -> Menu:
+        """Reload the menu immediately and return it"""
+        self.invalidate()
+        return self.get()
+
+    @property
+    def version(self) -> int:
+        return self._menu.version if self._menu else 0
+
+    def _reload(self) -> None:
+        rows = self._loader()
+        if rows is None:
+            logger.error("Failed to load menu; keeping previous version, retrying in %ss", self.retry_seconds)
+            self._retry_at = time.monotonic() + self.retry_seconds
+            return
+
+        items = tuple(MenuItem(int(item_id), name, to_cents(price)) for item_id, name, price in rows)
+        current = self._menu
+        if current is None or current.items != items:
+            version = menu_version(items)
+            self._menu = Menu(items, version)
+            logger.info("Loaded menu version %s with %s items", version, len(items))
+        self._loaded_at = time.monotonic()
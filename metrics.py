@@ -0,0 +1,230 @@
+"""
+In-process metrics in Prometheus text format
+
+Counters, gauges and fixed-bucket histograms kept in plain Python
+structures. Recording a value is a dict lookup, a bisect and a few
+additions under a lock, cheap enough for every webhook call and database
+statement. /metrics renders the registry in the Prometheus text exposition
+format, so any Prometheus-compatible scraper can collect it.
+"""
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow queries
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally per label values"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = self._header()
+        if not values and not self.labelnames:
+            values = [((), 0)]
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Current value, either set explicitly or read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self._callback = callback
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def set_callback(self, callback: Callable[[], float]) -> None:
+        self._callback = callback
+
+    def render(self) -> List[str]:
+        value = self._value
+        if self._callback is not None:
+            try:
+                value = self._callback()
+            except Exception:
+                value = float("nan")
+        return self._header() + [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram of observed values, optionally per label values"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, *labels: str):
+        """
+        Decorator that observes how long each call of a function or coroutine takes
+
+        For a histogram with labels, the label values default to the function's name.
+        """
+        def decorator(fn):
+            values = labels or ((fn.__name__,) if self.labelnames else ())
+
+            if asyncio.iscoroutinefunction(fn):
+                @wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        self.observe(time.perf_counter() - started, *values)
+                return async_wrapper
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, *values)
+            return wrapper
+        return decorator
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        lines = self._header()
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+webhook_latency = registry.histogram(
+    "webhook_request_duration_seconds", "Webhook handler latency by intent", ("intent",))
+webhook_errors = registry.counter(
+    "webhook_errors_total", "Webhook requests answered with an error, by intent", ("intent",))
+webhook_unsupported_intents = registry.counter(
+    "webhook_unsupported_intents_total", "Webhook requests for intents without a handler")
+db_function_latency = registry.histogram(
+    "db_function_duration_seconds", "Latency of db_helper functions", ("function",))
+db_statement_latency = registry.histogram(
+    "db_statement_duration_seconds", "Latency of individual SQL statements", ("statement",))
+db_statement_errors = registry.counter(
+    "db_statement_errors_total", "SQL statements that raised an error", ("statement",))
+save_to_db_latency = registry.histogram(
+    "save_to_db_duration_seconds", "End-to-end latency of saving a completed order")
+save_to_db_failures = registry.counter(
+    "save_to_db_failures_total", "Completed orders that could not be saved")
+session_store_size = registry.gauge(
+    "session_store_size", "In-progress carts held by the session store")
+
+
+def observe_statement(name: str, elapsed: float, failed: bool) -> None:
+    """StatementRegistry observer feeding the per-statement metrics"""
+    db_statement_latency.observe(elapsed, name)
+    if failed:
+        db_statement_errors.inc(name)
+
+
+def observe_intent(intent: str, elapsed: float, failed: bool) -> None:
+    """IntentRouter observer feeding the per-intent metrics"""
+    webhook_latency.observe(elapsed, intent)
+    if failed:
+        webhook_errors.inc(intent)
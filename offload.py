@@ -0,0 +1,89 @@
+"""
+Thread pool for running blocking work off the asyncio event loop
+
+Database calls in db_helper are synchronous. Running them on a dedicated,
+size-limited pool keeps one slow query from stalling every other request
+in the worker, while queue depth and wait time show when the pool is the
+bottleneck.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict
+
+# Worker threads for blocking database work; more threads than pooled
+# connections would only queue inside the connection pool instead
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", os.getenv("DB_POOL_SIZE", 5)))
+# Worker threads for the shared SQLite session store
+SESSION_EXECUTOR_WORKERS = int(os.getenv("SESSION_EXECUTOR_WORKERS", 4))
+
+
+class BlockingExecutor:
+    """Size-limited thread pool with queue depth and wait time instrumentation"""
+
+    def __init__(self, max_workers: int, name: str):
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run ``fn(*args)`` on the pool and await its result"""
+        submitted_at = time.perf_counter()
+        # Carry context variables into the worker thread like asyncio.to_thread
+        context = contextvars.copy_context()
+        with self._lock:
+            self._queued += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(self._call, submitted_at, context, fn, *args)
+        )
+
+    def _call(self, submitted_at: float, context: contextvars.Context, fn: Callable[..., Any], *args: Any) -> Any:
+        waited = time.perf_counter() - submitted_at
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        try:
+            return context.run(fn, *args)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self._completed + self._active
+            return {
+                "max_workers": self.max_workers,
+                "active": self._active,
+                "queued": self._queued,
+                "completed": self._completed,
+                "avg_wait_ms": round(self._wait_total / started * 1000, 3) if started else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+# Shared pool for every handler and endpoint that touches the database
+db_executor = BlockingExecutor(DB_EXECUTOR_WORKERS, "db")
+
+# Single thread for journal appends, so checkout never queues behind database work
+journal_executor = BlockingExecutor(1, "journal")
+
+# Cart reads and writes on the shared SQLite session store, which can wait
+# up to its busy timeout for another worker's write lock
+session_executor = BlockingExecutor(SESSION_EXECUTOR_WORKERS, "session")
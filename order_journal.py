@@ -0,0 +1,388 @@
+"""
+Write-behind order persistence backed by a durable local journal
+
+In write-behind mode checkout does not wait for the database. The priced
+order is appended to an fsync'd, append-only JSON-lines journal and the
+customer gets their order ID right away; a background thread drains the
+journal into the database in batches. A separate offset file records how
+far the journal has been applied, so orders accepted before a crash or
+restart are replayed on startup.
+
+Every worker process owns one journal slot, held with an exclusive file
+lock: orders.journal, orders.journal.1, orders.journal.2, ... On startup
+a worker also adopts the pending orders of slots no live process holds,
+so a worker that is not restarted cannot strand its accepted orders.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows; a single worker is assumed there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Enable write-behind checkout
+ORDER_WRITE_BEHIND = os.getenv("ORDER_WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+ORDER_JOURNAL_PATH = os.getenv("ORDER_JOURNAL_PATH", "orders.journal")
+# Orders written to the database per transaction
+ORDER_JOURNAL_BATCH_SIZE = int(os.getenv("ORDER_JOURNAL_BATCH_SIZE", 100))
+# Seconds the drain thread waits for a batch to fill up
+ORDER_JOURNAL_FLUSH_INTERVAL = float(os.getenv("ORDER_JOURNAL_FLUSH_INTERVAL", 0.2))
+# Attempts per order before it is moved to the dead-letter file; attempts
+# made while the database is unreachable do not count
+ORDER_JOURNAL_MAX_ATTEMPTS = 5
+# Seconds to back off after a failed drain, doubled up to the maximum
+RETRY_BACKOFF_INITIAL = 0.5
+RETRY_BACKOFF_MAX = 30.0
+
+
+class OrderJournal:
+    """Append-only JSON-lines file plus a checkpoint of the applied offset"""
+
+    def __init__(self, path: str, lock_file=None):
+        self.path = path
+        self._offset_path = path + ".offset"
+        self._failed_path = path + ".failed"
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        # Open file holding the slot's exclusive lock, if any
+        self._lock_file = lock_file
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """Durably append a record; returns the journal offset just past it"""
+        return self.append_many([record])[0]
+
+    def append_many(self, records: List[Dict[str, Any]]) -> List[int]:
+        """Durably append records with one fsync; returns the offset just past each"""
+        offsets = []
+        with self._lock:
+            for record in records:
+                self._file.write((json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8"))
+                offsets.append(self._file.tell())
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        return offsets
+
+    def committed_offset(self) -> int:
+        try:
+            with open(self._offset_path, "r") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def commit(self, offset: int) -> None:
+        """Record that everything before ``offset`` is in the database"""
+        tmp_path = self._offset_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._offset_path)
+
+    def read_pending(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Return (end offset, record) for every record after the checkpoint
+
+        A partially written last line (crash mid-append) is cut off so new
+        appends start on a clean line.
+        """
+        pending = []
+        with self._lock:
+            offset = self.committed_offset()
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        logger.warning("Discarding torn record at offset %s in %s", offset, self.path)
+                        self._file.truncate(offset)
+                        break
+                    offset += len(line)
+                    pending.append((offset, json.loads(line)))
+        return pending
+
+    def compact(self, offset: int) -> bool:
+        """Truncate the journal once everything in it has been applied"""
+        with self._lock:
+            if self._file.tell() != offset:
+                return False
+            self._file.truncate(0)
+            self._file.seek(0)
+            self.commit(0)
+            return True
+
+    def dead_letter(self, record: Dict[str, Any]) -> None:
+        with open(self._failed_path, "a") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self) -> None:
+        """Close the journal and give up its slot"""
+        self._file.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def _slot_path(base_path: str, slot: int) -> str:
+    return base_path if slot == 0 else f"{base_path}.{slot}"
+
+
+def _try_lock(journal_path: str):
+    """Take the slot's exclusive lock without waiting; returns the lock file or None"""
+    lock_file = open(journal_path + ".lock", "a")
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def claim_journal(base_path: str) -> OrderJournal:
+    """Open the first journal slot that no other process holds"""
+    if fcntl is None:
+        return OrderJournal(base_path)
+    slot = 0
+    while True:
+        path = _slot_path(base_path, slot)
+        lock_file = _try_lock(path)
+        if lock_file is not None:
+            return OrderJournal(path, lock_file)
+        slot += 1
+
+
+def orphaned_journals(base_path: str, own_path: str) -> List[OrderJournal]:
+    """
+    Lock and open every journal slot that no live process holds
+
+    The caller adopts their pending orders and closes them.
+    """
+    if fcntl is None:
+        return []
+    paths = [base_path] + [name for name in glob.glob(glob.escape(base_path) + ".*")
+                           if name[len(base_path) + 1:].isdigit()]
+    orphans = []
+    for path in paths:
+        if path == own_path or not os.path.exists(path):
+            continue
+        lock_file = _try_lock(path)
+        if lock_file is not None:
+            orphans.append(OrderJournal(path, lock_file))
+    return orphans
+
+
+class WriteBehindWriter:
+    """
+    Accepts orders into the journal and drains them into the database
+
+    Args:
+        journal: Journal that makes accepted orders durable
+        insert_orders: Writes a list of (order_id, lines, status) in one
+            transaction; returns 1 on success, 0 if the database could not
+            be reached and -1 if it rejected the orders
+        find_existing: Returns the subset of order IDs already in the
+            database, or None if that cannot be determined yet
+    """
+
+    def __init__(self, journal: OrderJournal,
+                 insert_orders: Callable[[List[tuple]], int],
+                 find_existing: Callable[[Iterable[int]], Optional[set]],
+                 batch_size: int = ORDER_JOURNAL_BATCH_SIZE,
+                 flush_interval: float = ORDER_JOURNAL_FLUSH_INTERVAL):
+        self.journal = journal
+        self._insert_orders = insert_orders
+        self._find_existing = find_existing
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._pending: List[Tuple[int, Dict[str, Any]]] = []
+        # Status of every accepted order not yet in the database, by order ID
+        self._pending_status: Dict[int, str] = {}
+        self._attempts: Dict[int, int] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        # Replayed orders not yet checked against the database for duplicates
+        self._unchecked = 0
+        self._accepted = 0
+        self._drained = 0
+        self._failed_batches = 0
+        self._dead_lettered = 0
+        self._last_drain_at: Optional[float] = None
+
+    def start(self, orphans: Iterable[OrderJournal] = ()) -> None:
+        """
+        Load unapplied orders from the journal and start draining
+
+        Args:
+            orphans: Journals left by processes that are gone. Their pending
+                orders are moved into this writer's journal, then they are
+                emptied and closed.
+        """
+        pending = self.journal.read_pending()
+        for orphan in orphans:
+            adopted = orphan.read_pending()
+            if adopted:
+                logger.info("Adopting %s journaled orders from %s", len(adopted), orphan.path)
+                records = [record for _, record in adopted]
+                pending.extend(zip(self.journal.append_many(records), records))
+                orphan.commit(adopted[-1][0])
+                orphan.compact(adopted[-1][0])
+            orphan.close()
+        if pending:
+            logger.info("Replaying %s journaled orders from %s", len(pending), self.journal.path)
+            # Orders applied just before a crash may be in the database already
+            self._unchecked = len(pending)
+        with self._cond:
+            self._pending = pending + self._pending
+            for _, record in pending:
+                self._pending_status[record["order_id"]] = record["status"]
+        self._thread = threading.Thread(target=self._run, name="order-journal", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Drain what is possible within ``timeout`` and stop the thread"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def submit(self, order_id: int, lines: List[tuple], status: str) -> None:
+        """
+        Durably accept an order for asynchronous insertion
+
+        Blocks for one fsync; call it from a worker thread, not the event loop.
+
+        Args:
+            order_id: Reserved order ID
+            lines: (item_id, quantity, total_cents) tuples
+            status: Initial tracking status
+        """
+        record = {"order_id": order_id, "lines": [list(line) for line in lines],
+                  "status": status, "ts": time.time()}
+        end_offset = self.journal.append(record)
+        with self._cond:
+            self._pending.append((end_offset, record))
+            self._pending_status[order_id] = status
+            self._accepted += 1
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _run(self) -> None:
+        backoff = RETRY_BACKOFF_INITIAL
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if len(self._pending) < self.batch_size and not self._stopping:
+                    # Give the batch a moment to fill up
+                    self._cond.wait(self.flush_interval)
+                if self._stopping and not self._pending:
+                    return
+                batch = self._pending[:self.batch_size]
+
+            if not batch:
+                continue
+            if self._drain(batch):
+                backoff = RETRY_BACKOFF_INITIAL
+            else:
+                if self._stopping:
+                    return
+                time.sleep(backoff)
+                backoff = min(backoff * 2, RETRY_BACKOFF_MAX)
+
+    def _drain(self, batch: List[Tuple[int, Dict[str, Any]]]) -> bool:
+        """
+        Apply a batch; returns False if the drain should back off
+
+        That is the case when the database is unreachable, and when an
+        order it rejected was retried or dead-lettered.
+        """
+        if self._unchecked:
+            existing = self._find_existing([record["order_id"] for _, record in batch[:self._unchecked]])
+            if existing is None:
+                return False
+            if existing:
+                logger.info("Skipping %s journaled orders already in the database", len(existing))
+            batch_to_insert = [entry for entry in batch if entry[1]["order_id"] not in existing]
+        else:
+            batch_to_insert = batch
+
+        orders = [(record["order_id"], record["lines"], record["status"]) for _, record in batch_to_insert]
+        result = self._insert_orders(orders) if orders else 1
+        if result == 1:
+            self._applied(batch)
+            return True
+
+        self._failed_batches += 1
+        if result == 0:
+            # An outage says nothing about the orders: keep the batch and back off
+            logger.error("Database unavailable; keeping %s journaled orders", len(orders))
+            return False
+
+        logger.error("Failed to write batch of %s journaled orders; retrying one by one", len(orders))
+        # Isolate the rejected order so it cannot block the rest of the journal
+        applied = []
+        clean = True
+        for entry in batch:
+            end_offset, record = entry
+            if entry in batch_to_insert:
+                result = self._insert_orders([(record["order_id"], record["lines"], record["status"])])
+                if result == 0:
+                    clean = False
+                    break
+                if result != 1:
+                    clean = False
+                    attempts = self._attempts.get(record["order_id"], 0) + 1
+                    self._attempts[record["order_id"]] = attempts
+                    if attempts < ORDER_JOURNAL_MAX_ATTEMPTS:
+                        break
+                    logger.error("Giving up on journaled order %s after %s attempts", record['order_id'], attempts)
+                    self.journal.dead_letter(record)
+                    self._dead_lettered += 1
+            self._attempts.pop(record["order_id"], None)
+            applied.append(entry)
+
+        if applied:
+            self._applied(applied)
+        return clean
+
+    def _applied(self, entries: List[Tuple[int, Dict[str, Any]]]) -> None:
+        end_offset = entries[-1][0]
+        self.journal.commit(end_offset)
+        with self._cond:
+            del self._pending[:len(entries)]
+            for _, record in entries:
+                self._pending_status.pop(record["order_id"], None)
+            self._drained += len(entries)
+            self._last_drain_at = time.time()
+            self._unchecked = max(0, self._unchecked - len(entries))
+            if not self._pending:
+                self.journal.compact(end_offset)
+
+    def pending_status(self, order_id: int) -> Optional[str]:
+        """Status of an accepted order that is not in the database yet, or None"""
+        return self._pending_status.get(order_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            oldest = self._pending[0][1]["ts"] if self._pending else None
+            return {
+                "pending": len(self._pending),
+                "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+                "accepted": self._accepted,
+                "drained": self._drained,
+                "failed_batches": self._failed_batches,
+                "dead_lettered": self._dead_lettered,
+                "last_drain_at": self._last_drain_at,
+            }
@@ -0,0 +1,302 @@
+"""
+Append-only journal of in-memory cart changes for warm restarts
+
+The in-memory SessionStore loses every in-progress cart when the process
+restarts. With SESSION_JOURNAL=1 each change to a cart (add, remove,
+checkout, expiry or eviction) is appended to a compact binary log as either
+the cart's new encoded state or a delete marker. A snapshot of all live
+carts is written periodically by compacting the log on a background thread:
+the previous snapshot and the finished generations are folded into a new
+snapshot, and the folded generations are deleted. Compaction reads only the
+journal files, so it never holds the store lock or re-encodes carts.
+
+On startup the snapshot is mmap'd and decoded in place, then the log
+generations written after it are replayed, restoring every cart that had
+not expired.
+
+Files, for SESSION_JOURNAL_PATH=sessions.journal:
+    sessions.journal.snapshot   live carts as of one generation
+    sessions.journal.<N>        changes made during generation N
+
+Each worker process holds one journal with an exclusive file lock. The
+first process uses sessions.journal, and the others use sessions.journal-1,
+sessions.journal-2 and so on, so workers never write or delete each
+other's generations.
+"""
+
+import glob
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows; a single worker is assumed there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Enable the journal for the in-memory session store
+SESSION_JOURNAL = os.getenv("SESSION_JOURNAL", "0").lower() in ("1", "true", "yes")
+SESSION_JOURNAL_PATH = os.getenv("SESSION_JOURNAL_PATH", "sessions.journal")
+# Journal records written before a new snapshot is taken
+SESSION_SNAPSHOT_EVERY = int(os.getenv("SESSION_SNAPSHOT_EVERY", 100000))
+
+RECORD_SET = 1
+RECORD_DELETE = 2
+
+# type, wall-clock time of the change, session ID length, payload length
+_RECORD = struct.Struct("<BdHI")
+# magic, format version, generation, record count
+_SNAPSHOT_HEADER = struct.Struct("<4sHQI")
+_SNAPSHOT_MAGIC = b"CSNP"
+_SNAPSHOT_VERSION = 1
+
+
+def _pack_record(kind: int, session_id: str, payload: bytes, touched_at: float) -> bytes:
+    key = session_id.encode("utf-8")
+    return _RECORD.pack(kind, touched_at, len(key), len(payload)) + key + payload
+
+
+def _iter_records(buffer, offset: int = 0):
+    """Yield (kind, session_id, payload, touched_at, end offset), stopping at a torn record"""
+    size = len(buffer)
+    while offset + _RECORD.size <= size:
+        kind, touched_at, key_len, payload_len = _RECORD.unpack_from(buffer, offset)
+        start = offset + _RECORD.size
+        end = start + key_len + payload_len
+        if end > size or kind not in (RECORD_SET, RECORD_DELETE):
+            return
+        session_id = bytes(buffer[start:start + key_len]).decode("utf-8")
+        payload = bytes(buffer[start + key_len:end])
+        yield kind, session_id, payload, touched_at, end
+        offset = end
+
+
+class SessionJournal:
+    """
+    Binary change log plus snapshots for one process's session store
+
+    Args:
+        path: Base path of the journal files
+        encode: Converts a cart to bytes
+        decode: Converts bytes back to a cart
+        snapshot_every: Records appended before snapshot_due() turns true
+    """
+
+    def __init__(self, path: str, encode: Callable[[Any], bytes], decode: Callable[[bytes], Any],
+                 snapshot_every: int = SESSION_SNAPSHOT_EVERY, lock_file=None):
+        self.path = path
+        # Open file holding this journal's exclusive lock, if any
+        self._lock_file = lock_file
+        self.encode = encode
+        self._decode = decode
+        self.snapshot_every = max(1, snapshot_every)
+        self._snapshot_path = path + ".snapshot"
+        self._lock = threading.Lock()
+        self._file = None
+        self.generation = 0
+        self._records = 0
+        self._snapshot_running = False
+        self.snapshots = 0
+        self.last_snapshot_ms = 0.0
+        self.recovered = 0
+        self.recovery_ms = 0.0
+
+    @classmethod
+    def claim(cls, base_path: str, encode: Callable[[Any], bytes], decode: Callable[[bytes], Any],
+              snapshot_every: int = SESSION_SNAPSHOT_EVERY) -> "SessionJournal":
+        """Open the first journal under ``base_path`` that no other process holds"""
+        if fcntl is None:
+            return cls(base_path, encode, decode, snapshot_every)
+        slot = 0
+        while True:
+            path = base_path if slot == 0 else f"{base_path}-{slot}"
+            lock_file = open(path + ".lock", "a")
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                slot += 1
+                continue
+            return cls(path, encode, decode, snapshot_every, lock_file)
+
+    def _generation_path(self, generation: int) -> str:
+        return f"{self.path}.{generation}"
+
+    def _generations(self) -> List[int]:
+        generations = []
+        for name in glob.glob(glob.escape(self.path) + ".*"):
+            suffix = name[len(self.path) + 1:]
+            if suffix.isdigit():
+                generations.append(int(suffix))
+        return sorted(generations)
+
+    def _fold(self, before: Optional[int] = None) -> Tuple[Dict[str, Tuple[bytes, float]], List[int]]:
+        """
+        Apply the snapshot and the log generations after it, without decoding carts
+
+        Args:
+            before: Only fold generations older than this one
+
+        Returns:
+            tuple: ({session_id: (payload, touched_at)} ordered by last change,
+                   every generation number seen, including the snapshot's)
+        """
+        state: Dict[str, Tuple[bytes, float]] = {}
+        snapshot_generation = 0
+
+        try:
+            with open(self._snapshot_path, "rb") as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                magic, version, snapshot_generation, count = _SNAPSHOT_HEADER.unpack_from(view)
+                if magic != _SNAPSHOT_MAGIC or version != _SNAPSHOT_VERSION:
+                    raise ValueError(f"unrecognized snapshot format in {self._snapshot_path}")
+                for _, session_id, payload, touched_at, _ in _iter_records(view, _SNAPSHOT_HEADER.size):
+                    state[session_id] = (payload, touched_at)
+        except FileNotFoundError:
+            pass
+        except (ValueError, struct.error, OSError) as e:
+            logger.error("Ignoring unreadable session snapshot: %s", e)
+            state = {}
+            snapshot_generation = 0
+
+        generations = self._generations()
+        for generation in generations:
+            if generation < snapshot_generation or (before is not None and generation >= before):
+                continue
+            with open(self._generation_path(generation), "rb") as f:
+                data = f.read()
+            for kind, session_id, payload, touched_at, _ in _iter_records(data):
+                # Re-inserting keeps the dict ordered by last change, like the store
+                state.pop(session_id, None)
+                if kind == RECORD_SET:
+                    state[session_id] = (payload, touched_at)
+        return state, [snapshot_generation] + generations
+
+    def load(self) -> List[Tuple[str, Any, float]]:
+        """
+        Recover carts from the snapshot and the log generations after it
+
+        Returns:
+            list: (session_id, cart, touched_at), least recently changed first
+        """
+        started = time.perf_counter()
+        state, generations = self._fold()
+
+        carts = []
+        for session_id, (payload, touched_at) in state.items():
+            try:
+                carts.append((session_id, self._decode(payload), touched_at))
+            except Exception as e:
+                logger.error("Dropping unreadable journaled cart for session %s: %s", session_id, e)
+
+        self.generation = max(generations)
+        self.recovered = len(carts)
+        self.recovery_ms = round((time.perf_counter() - started) * 1000, 3)
+        logger.info("Recovered %s carts from %s in %s ms", len(carts), self.path, self.recovery_ms)
+        return carts
+
+    def start_generation(self) -> int:
+        """Switch appends to a new, empty log generation and return its number"""
+        with self._lock:
+            if self._file:
+                self._file.close()
+            self.generation += 1
+            self._file = open(self._generation_path(self.generation), "ab")
+            self._records = 0
+            return self.generation
+
+    def append_set(self, session_id: str, cart: Any, touched_at: float) -> None:
+        self._append(_pack_record(RECORD_SET, session_id, self.encode(cart), touched_at))
+
+    def append_delete(self, session_id: str) -> None:
+        self._append(_pack_record(RECORD_DELETE, session_id, b"", time.time()))
+
+    def _append(self, record: bytes) -> None:
+        # Flushed to the OS on every change, which survives a process crash;
+        # snapshots are fsync'd
+        with self._lock:
+            self._file.write(record)
+            self._file.flush()
+            self._records += 1
+
+    def snapshot_due(self) -> bool:
+        return self._records >= self.snapshot_every and not self._snapshot_running
+
+    def begin_snapshot(self) -> Optional[int]:
+        """
+        Start a new generation for a snapshot, or return None if one is running
+
+        Every change appended before this call lands in an older generation
+        and is folded into the snapshot; every later change is replayed on
+        top of it.
+        """
+        with self._lock:
+            if self._snapshot_running:
+                return None
+            self._snapshot_running = True
+        return self.start_generation()
+
+    def write_snapshot(self, generation: int, ttl: Optional[float] = None) -> None:
+        """
+        Compact the log: fold generations before ``generation`` into a new snapshot
+
+        Runs on a background thread. It reads only the journal files, so the
+        store keeps serving requests and carts are never re-encoded.
+
+        Args:
+            generation: Generation returned by begin_snapshot()
+            ttl: Leave out carts that have not changed for this many seconds
+        """
+        started = time.perf_counter()
+        try:
+            state, _ = self._fold(before=generation)
+            if ttl is not None:
+                cutoff = time.time() - ttl
+                state = {session_id: entry for session_id, entry in state.items() if entry[1] > cutoff}
+
+            tmp_path = self._snapshot_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, generation, len(state)))
+                f.writelines(_pack_record(RECORD_SET, session_id, payload, touched_at)
+                             for session_id, (payload, touched_at) in state.items())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._snapshot_path)
+
+            for old in self._generations():
+                if old < generation:
+                    os.remove(self._generation_path(old))
+            self.snapshots += 1
+            self.last_snapshot_ms = round((time.perf_counter() - started) * 1000, 3)
+            logger.info("Wrote session snapshot of %s carts at generation %s", len(state), generation)
+        except Exception as e:
+            logger.error("Failed to write session snapshot: %s", e)
+        finally:
+            with self._lock:
+                self._snapshot_running = False
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "generation": self.generation,
+            "records_since_snapshot": self._records,
+            "snapshots": self.snapshots,
+            "last_snapshot_ms": self.last_snapshot_ms,
+            "recovered": self.recovered,
+            "recovery_ms": self.recovery_ms,
+        }
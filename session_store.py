@@ -0,0 +1,378 @@
+"""
+Storage for in-progress carts, keyed by Dialogflow session ID
+
+Abandoned carts used to live until the process restarted. SessionStore
+expires carts that have been idle longer than a TTL and caps the number of
+resident sessions, evicting the least recently used ones first.
+
+With SESSION_JOURNAL=1 the in-memory store logs every change to a
+SessionJournal and recovers its carts from it on startup.
+
+SQLiteSessionStore offers the same interface backed by a SQLite database
+in WAL mode, so every uvicorn worker on a node sees the same carts.
+Select it with SESSION_BACKEND=sqlite.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from session_journal import SESSION_JOURNAL, SESSION_JOURNAL_PATH, SessionJournal
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cart may sit idle before it is discarded
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", 1800))
+# Maximum number of resident carts
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", 100000))
+# Minimum seconds between expiry sweeps
+SESSION_SWEEP_INTERVAL = 1.0
+# "memory" for a per-process store, "sqlite" to share carts between workers
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+
+
+class SessionStore:
+    """
+    In-process cart store with idle TTL and LRU eviction
+
+    Entries live in an OrderedDict ordered by last access. Because every
+    entry has the same idle TTL, that order is also expiry order: the sweeper
+    only pops expired entries off the front and stops at the first live one,
+    so a sweep costs O(expired), never a scan of every session.
+
+    If a journal is given, every change is appended to it while the store
+    lock is held, so the log order matches the order changes were applied.
+    Snapshots compact the journal files on a background thread and never
+    take the store lock.
+    """
+
+    # Calls never wait on other processes, so they can run on the event loop
+    blocking = False
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, max_entries: int = SESSION_MAX_ENTRIES,
+                 journal: Optional[SessionJournal] = None):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._data: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.expired = 0
+        self.evicted = 0
+        self._journal = journal
+        if journal:
+            self._recover()
+
+    def _recover(self) -> None:
+        """Load journaled carts, then snapshot them so replay starts from a clean generation"""
+        now = time.monotonic()
+        wall_now = time.time()
+        for session_id, cart, touched_at in self._journal.load():
+            age = max(0.0, wall_now - touched_at)
+            if age < self.ttl:
+                self._data[sys.intern(session_id)] = [cart, now - age]
+        # Appends need an open generation; the recovered state is compacted into a snapshot behind it
+        generation = self._journal.begin_snapshot()
+        while len(self._data) > self.max_entries:
+            session_id, _ = self._data.popitem(last=False)
+            self._journal.append_delete(session_id)
+        threading.Thread(target=self._journal.write_snapshot, args=(generation, self.ttl),
+                         name="session-snapshot", daemon=True).start()
+
+    def _start_snapshot(self) -> None:
+        generation = self._journal.begin_snapshot()
+        if generation is not None:
+            threading.Thread(target=self._journal.write_snapshot, args=(generation, self.ttl),
+                             name="session-snapshot", daemon=True).start()
+
+    def _maybe_snapshot(self) -> None:
+        """Snapshot in the background once enough changes have been journaled"""
+        if self._journal and self._journal.snapshot_due():
+            self._start_snapshot()
+
+    def _evict_lru(self) -> None:
+        while len(self._data) > self.max_entries:
+            session_id, _ = self._data.popitem(last=False)
+            self.evicted += 1
+            if self._journal:
+                self._journal.append_delete(session_id)
+
+    def get(self, session_id: str) -> Optional[Any]:
+        """Return the cart for a session, or None if absent or expired"""
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_sweep(now)
+            entry = self._data.get(session_id)
+            if entry is None:
+                return None
+            if now - entry[1] >= self.ttl:
+                del self._data[session_id]
+                self.expired += 1
+                if self._journal:
+                    self._journal.append_delete(session_id)
+                return None
+            entry[1] = now
+            self._data.move_to_end(session_id)
+            return entry[0]
+
+    def set(self, session_id: str, cart: Any) -> None:
+        """Store a cart, evicting least recently used carts beyond the cap"""
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_sweep(now)
+            self._data[session_id] = [cart, now]
+            self._data.move_to_end(session_id)
+            if self._journal:
+                self._journal.append_set(session_id, cart, time.time())
+            self._evict_lru()
+        self._maybe_snapshot()
+
+    def update(self, session_id: str, fn: Callable[[Optional[Any]], Optional[Any]]) -> Optional[Any]:
+        """
+        Atomically read-modify-write a session's cart
+
+        ``fn`` receives the current cart (None if absent or expired) and
+        returns the new cart, or None to delete it. Returns the new cart.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_sweep(now)
+            entry = self._data.get(session_id)
+            cart = entry[0] if entry is not None and now - entry[1] < self.ttl else None
+            new_cart = fn(cart)
+            if new_cart is None:
+                if self._data.pop(session_id, None) is not None and self._journal:
+                    self._journal.append_delete(session_id)
+            else:
+                self._data[session_id] = [new_cart, now]
+                self._data.move_to_end(session_id)
+                if self._journal:
+                    self._journal.append_set(session_id, new_cart, time.time())
+                self._evict_lru()
+        self._maybe_snapshot()
+        return new_cart
+
+    def pop(self, session_id: str) -> Optional[Any]:
+        """Remove and return a session's cart, or None if absent or expired"""
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_sweep(now)
+            entry = self._data.pop(session_id, None)
+            if entry is None:
+                return None
+            if self._journal:
+                self._journal.append_delete(session_id)
+            if now - entry[1] >= self.ttl:
+                self.expired += 1
+                return None
+            return entry[0]
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def sweep(self) -> int:
+        """Drop every expired cart; returns how many were dropped"""
+        with self._lock:
+            return self._sweep(time.monotonic())
+
+    def _maybe_sweep(self, now: float) -> None:
+        if now - self._last_sweep >= SESSION_SWEEP_INTERVAL:
+            self._sweep(now)
+
+    def _sweep(self, now: float) -> int:
+        self._last_sweep = now
+        cutoff = now - self.ttl
+        dropped = 0
+        data = self._data
+        while data:
+            session_id = next(iter(data))
+            if data[session_id][1] > cutoff:
+                break
+            del data[session_id]
+            dropped += 1
+            if self._journal:
+                self._journal.append_delete(session_id)
+        self.expired += dropped
+        return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "journal": self._journal.stats() if self._journal else None,
+        }
+
+
+class SQLiteSessionStore:
+    """
+    Cart store shared by all worker processes through a SQLite database
+
+    WAL mode lets readers proceed while one writer commits, and every
+    read-modify-write runs inside BEGIN IMMEDIATE so two workers can never
+    interleave updates to the same cart. Expiry and the size cap use an
+    index on touched_at, so sweeps delete a range instead of scanning.
+    Each thread gets its own connection.
+    """
+
+    # Writes can wait up to the busy timeout for another worker's lock;
+    # callers on the event loop should run them in a thread pool
+    blocking = True
+
+    def __init__(self, path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL_SECONDS,
+                 max_entries: int = SESSION_MAX_ENTRIES,
+                 encode: Callable[[Any], Any] = json.dumps,
+                 decode: Callable[[Any], Any] = json.loads):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._encode = encode
+        self._decode = decode
+        self._local = threading.local()
+        self._last_sweep = 0.0
+        self.expired = 0
+        self.evicted = 0
+
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                cart BLOB NOT NULL,
+                touched_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_touched_at ON sessions (touched_at)")
+        logger.info("Using shared SQLite session store at %s", path)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[Any]:
+        """Return the cart for a session, or None if absent or expired"""
+        now = time.time()
+        conn = self._conn()
+        self._maybe_sweep(conn, now)
+        row = conn.execute(
+            "SELECT cart FROM sessions WHERE session_id = ? AND touched_at > ?",
+            (session_id, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE sessions SET touched_at = ? WHERE session_id = ?", (now, session_id))
+        return self._decode(row[0])
+
+    def set(self, session_id: str, cart: Any) -> None:
+        now = time.time()
+        conn = self._conn()
+        self._maybe_sweep(conn, now)
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, cart, touched_at) VALUES (?, ?, ?)",
+            (session_id, self._encode(cart), now)
+        )
+
+    def update(self, session_id: str, fn: Callable[[Optional[Any]], Optional[Any]]) -> Optional[Any]:
+        """Atomically read-modify-write a session's cart across all workers"""
+        now = time.time()
+        conn = self._conn()
+        self._maybe_sweep(conn, now)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT cart FROM sessions WHERE session_id = ? AND touched_at > ?",
+                (session_id, now - self.ttl)
+            ).fetchone()
+            new_cart = fn(self._decode(row[0]) if row else None)
+            if new_cart is None:
+                conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, cart, touched_at) VALUES (?, ?, ?)",
+                    (session_id, self._encode(new_cart), now)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return new_cart
+
+    def pop(self, session_id: str) -> Optional[Any]:
+        now = time.time()
+        conn = self._conn()
+        self._maybe_sweep(conn, now)
+        row = conn.execute(
+            "DELETE FROM sessions WHERE session_id = ? RETURNING cart, touched_at", (session_id,)
+        ).fetchall()
+        row = row[0] if row else None
+        if row is None or row[1] <= now - self.ttl:
+            return None
+        return self._decode(row[0])
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def sweep(self) -> int:
+        return self._sweep(self._conn(), time.time())
+
+    def _maybe_sweep(self, conn: sqlite3.Connection, now: float) -> None:
+        if now - self._last_sweep >= SESSION_SWEEP_INTERVAL:
+            self._sweep(conn, now)
+
+    def _sweep(self, conn: sqlite3.Connection, now: float) -> int:
+        self._last_sweep = now
+        expired = conn.execute("DELETE FROM sessions WHERE touched_at <= ?", (now - self.ttl,)).rowcount
+        evicted = conn.execute(
+            "DELETE FROM sessions WHERE session_id IN ("
+            "SELECT session_id FROM sessions ORDER BY touched_at "
+            "LIMIT MAX(0, (SELECT COUNT(*) FROM sessions) - ?))",
+            (self.max_entries,)
+        ).rowcount
+        self.expired += expired
+        self.evicted += evicted
+        return expired
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite",
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+def create_session_store(**kwargs):
+    """Build the session store selected by SESSION_BACKEND"""
+    if SESSION_BACKEND == "sqlite":
+        return SQLiteSessionStore(**kwargs)
+    journal = None
+    if SESSION_JOURNAL:
+        journal = SessionJournal.claim(
+            SESSION_JOURNAL_PATH,
+            kwargs.get("encode", lambda cart: json.dumps(cart).encode("utf-8")),
+            kwargs.get("decode", json.loads)
+        )
+    return SessionStore(journal=journal,
+                        **{key: value for key, value in kwargs.items() if key in ("ttl", "max_entries")})
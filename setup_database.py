@@ -53,7 +53,8 @@ def create_database_and_tables():
             CREATE TABLE IF NOT EXISTS food_items (
                 item_id INT AUTO_INCREMENT PRIMARY KEY,
                 name VARCHAR(255) NOT NULL,
-                price DECIMAL(10, 2) NOT NULL
+                price DECIMAL(10, 2) NOT NULL,
+                INDEX idx_food_items_name (name)
             )
         """)
         
@@ -79,6 +80,19 @@ def create_database_and_tables():
             )
         """)
         
+        # Create order ID sequence table used for atomic order ID allocation
+        print("Creating order_id_sequence table...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS order_id_sequence (
+                name VARCHAR(64) PRIMARY KEY,
+                next_id INT NOT NULL
+            )
+        """)
+        cursor.execute("""
+            INSERT IGNORE INTO order_id_sequence (name, next_id)
+            SELECT 'orders', IFNULL(MAX(order_id), 0) + 1 FROM orders
+        """)
+        
         # Insert sample food items
         print("Inserting sample food items...")
         sample_items = [
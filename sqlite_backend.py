@@ -0,0 +1,191 @@
+"""
+Embedded SQLite storage backend for Pandeyji Eatery
+
+Lets the full ordering flow in main.app run without a MySQL server, e.g.
+on a laptop or in CI. The schema mirrors setup_database.py and every
+statement db_helper uses is registered here in SQLite syntax.
+
+Enable it with DB_BACKEND=sqlite. SQLITE_PATH selects the database file;
+use ":memory:" for a throwaway in-memory database.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from decimal import Decimal
+
+from db_pool import StatementRegistry
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "pandeyji_eatery.db")
+
+# Store DECIMAL values exactly as text; the NUMERIC column affinity converts them
+sqlite3.register_adapter(Decimal, str)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS food_items (
+    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(255) NOT NULL COLLATE NOCASE,
+    price DECIMAL(10, 2) NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_food_items_name ON food_items (name);
+
+CREATE TABLE IF NOT EXISTS orders (
+    order_id INT NOT NULL,
+    item_id INT NOT NULL,
+    quantity INT NOT NULL,
+    total_price DECIMAL(10, 2) NOT NULL,
+    PRIMARY KEY (order_id, item_id),
+    FOREIGN KEY (item_id) REFERENCES food_items(item_id)
+);
+
+CREATE TABLE IF NOT EXISTS order_tracking (
+    order_id INT PRIMARY KEY,
+    status VARCHAR(100) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS order_id_sequence (
+    name VARCHAR(64) PRIMARY KEY,
+    next_id INT NOT NULL
+);
+"""
+
+# Same sample menu as setup_database.py
+SAMPLE_ITEMS = [
+    ("Pav Bhaji", "2.50"),
+    ("Chole Bhature", "3.00"),
+    ("Pizza", "8.50"),
+    ("Mango Lassi", "2.00"),
+    ("Masala Dosa", "4.00"),
+    ("Biryani", "6.50"),
+    ("Vada Pav", "1.50"),
+    ("Samosa", "1.00"),
+    ("Idli", "2.50"),
+    ("Dhokla", "2.00")
+]
+
+# SQLite statements; sqlite3 keeps compiled statements in a per-connection cache
+statements = StatementRegistry()
+statements.register(
+    "insert_order_item",
+    "INSERT INTO orders (order_id, item_id, quantity, total_price) "
+    "SELECT ?3, item_id, ?2, price * ?2 FROM food_items WHERE name = ?1"
+)
+statements.register_sized(
+    "insert_order_lines",
+    lambda size: "INSERT INTO orders (order_id, item_id, quantity, total_price) VALUES "
+                 + ", ".join(["(?, ?, ?, ?)"] * size)
+)
+statements.register("insert_order_tracking", "INSERT INTO order_tracking (order_id, status) VALUES (?, ?)")
+statements.register("update_order_status", "UPDATE order_tracking SET status = ? WHERE order_id = ?")
+statements.register("select_order_total", "SELECT IFNULL(SUM(total_price), 0) FROM orders WHERE order_id = ?")
+statements.register("select_food_items", "SELECT item_id, name, price FROM food_items ORDER BY item_id")
+statements.register(
+    "create_order_sequence",
+    "CREATE TABLE IF NOT EXISTS order_id_sequence (name VARCHAR(64) PRIMARY KEY, next_id INT NOT NULL)"
+)
+# The UPDATE takes SQLite's write lock, so the following read of the same row
+# inside the transaction sees exactly the block this caller reserved
+statements.register(
+    "advance_order_sequence",
+    "UPDATE order_id_sequence SET next_id = next_id + ? WHERE name = 'orders'"
+)
+statements.register(
+    "seed_order_sequence",
+    "INSERT OR IGNORE INTO order_id_sequence (name, next_id) "
+    "SELECT 'orders', IFNULL(MAX(order_id), 0) + 1 FROM orders"
+)
+statements.register("select_reserved_block_end", "SELECT next_id FROM order_id_sequence WHERE name = 'orders'")
+statements.register("select_order_status", "SELECT status FROM order_tracking WHERE order_id = ?")
+statements.register_sized(
+    "select_order_statuses",
+    lambda size: "SELECT order_id, status FROM order_tracking WHERE order_id IN ("
+                 + ", ".join(["?"] * size) + ")"
+)
+
+
+class _SQLiteConnection:
+    """Adapts sqlite3.Connection to the interface ConnectionPool expects"""
+
+    __slots__ = ("_conn", "_closed")
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._closed = False
+
+    def cursor(self, prepared=False):
+        # sqlite3 always prepares statements and caches them per connection
+        return self._conn.cursor()
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def is_connected(self):
+        return not self._closed
+
+    def close(self):
+        self._closed = True
+        self._conn.close()
+
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+# Keeps a shared in-memory database alive while pooled connections come and go
+_memory_keeper = None
+
+
+def _open(path):
+    if path == ":memory:":
+        conn = sqlite3.connect(
+            "file:pandeyji_eatery?mode=memory&cache=shared",
+            uri=True,
+            check_same_thread=False
+        )
+    else:
+        conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+def _ensure_schema(conn):
+    conn.executescript(SCHEMA)
+    if conn.execute("SELECT COUNT(*) FROM food_items").fetchone()[0] == 0:
+        conn.executemany("INSERT INTO food_items (name, price) VALUES (?, ?)", SAMPLE_ITEMS)
+        logger.info("Inserted %s sample food items into SQLite database", len(SAMPLE_ITEMS))
+    conn.commit()
+
+
+def connect(path=None):
+    """
+    Open a pooled SQLite connection, creating the schema on first use
+
+    Returns:
+        _SQLiteConnection: Connection wrapper, or None if the database could not be opened
+    """
+    global _schema_ready, _memory_keeper
+    path = path or SQLITE_PATH
+    try:
+        conn = _open(path)
+        if not _schema_ready:
+            with _schema_lock:
+                if not _schema_ready:
+                    if path == ":memory:" and _memory_keeper is None:
+                        _memory_keeper = _open(path)
+                    _ensure_schema(conn)
+                    _schema_ready = True
+                    logger.info("Using SQLite database at %s", path)
+        return _SQLiteConnection(conn)
+    except sqlite3.Error as e:
+        logger.error("Error opening SQLite database %s: %s", path, e)
+        return None
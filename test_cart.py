@@ -0,0 +1,75 @@
+"""
+Regression tests for the compact Cart
+"""
+
+import pytest
+
+from cart import MAX_UINT32, Cart
+from menu import Menu, MenuItem
+from session_store import SessionStore
+
+SAMOSA = MenuItem(1, "Samosa", 550)
+PIZZA = MenuItem(2, "Pizza", 800)
+IDLI = MenuItem(3, "Idli", 400)
+
+
+def test_add_rejects_quantity_that_does_not_fit():
+    cart = Cart()
+    cart.add(SAMOSA, 1)
+
+    with pytest.raises(ValueError):
+        cart.add(PIZZA, 5_000_000_000)
+
+    # The failed add must not leave a stray item ID behind
+    cart.add(IDLI, 1)
+    assert cart.as_dict() == {1: 1, 3: 1}
+    assert cart.total_cents == 950
+
+
+def test_add_rejects_total_that_does_not_fit():
+    cart = Cart()
+    with pytest.raises(ValueError):
+        cart.add(MenuItem(4, "Thali", MAX_UINT32), 2)
+    assert len(cart) == 0
+    assert cart.total_cents == 0
+
+
+def test_failed_update_leaves_stored_cart_unchanged():
+    store = SessionStore()
+    cart = Cart()
+    cart.add(SAMOSA, 1)
+    store.set("s1", cart)
+
+    def merge(current):
+        current = current.copy()
+        current.add(IDLI, 1)
+        current.add(PIZZA, 5_000_000_000)
+        return current
+
+    with pytest.raises(ValueError):
+        store.update("s1", merge)
+    assert store.get("s1").as_dict() == {1: 1}
+
+
+def test_remove_after_price_increase_reprices_first():
+    cart = Cart(menu_version=1)
+    cart.add(SAMOSA, 2)
+    newer = Menu([MenuItem(1, "Samosa", 650), PIZZA, IDLI], version=2)
+
+    cart.reprice(newer)
+    assert cart.remove(newer.get_by_id(1))
+    assert cart.total_cents == 0
+    assert cart.menu_version == 2
+    cart.to_bytes()
+
+
+def test_bytes_round_trip():
+    cart = Cart(menu_version=7)
+    cart.add(SAMOSA, 2)
+    cart.add(PIZZA, 1)
+    cart.add(SAMOSA, 1)
+
+    restored = Cart.from_bytes(cart.to_bytes())
+    assert restored.as_dict() == {1: 3, 2: 1}
+    assert restored.total_cents == 2450
+    assert restored.menu_version == 7
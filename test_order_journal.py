@@ -0,0 +1,108 @@
+"""
+Tests for the write-behind order journal
+"""
+
+import threading
+import time
+
+import order_journal
+from order_journal import OrderJournal, WriteBehindWriter
+
+
+class FakeDatabase:
+    """Stands in for insert_orders and find_existing; can go down and come back"""
+
+    def __init__(self):
+        self.orders = {}
+        self.available = True
+        self.rejected = set()
+        self.inserted = threading.Event()
+
+    def insert_orders(self, orders):
+        if not self.available:
+            return 0
+        if any(order_id in self.rejected for order_id, _, _ in orders):
+            return -1
+        for order_id, lines, status in orders:
+            self.orders[order_id] = status
+        self.inserted.set()
+        return 1
+
+    def find_existing(self, order_ids):
+        if not self.available:
+            return None
+        return {order_id for order_id in order_ids if order_id in self.orders}
+
+
+def make_writer(path, db):
+    return WriteBehindWriter(OrderJournal(str(path)), db.insert_orders, db.find_existing,
+                             batch_size=10, flush_interval=0)
+
+
+def test_outage_does_not_dead_letter_orders(tmp_path, monkeypatch):
+    monkeypatch.setattr(order_journal, "RETRY_BACKOFF_INITIAL", 0.001)
+    monkeypatch.setattr(order_journal, "RETRY_BACKOFF_MAX", 0.001)
+    db = FakeDatabase()
+    db.available = False
+    writer = make_writer(tmp_path / "orders.journal", db)
+    writer.start()
+    for order_id in range(1, 4):
+        writer.submit(order_id, [(1, 2, 1100)], "in progress")
+
+    # Far more failed drains than ORDER_JOURNAL_MAX_ATTEMPTS
+    while writer.stats()["failed_batches"] < 4 * order_journal.ORDER_JOURNAL_MAX_ATTEMPTS:
+        time.sleep(0.001)
+    assert writer.pending_status(1) == "in progress"
+
+    db.available = True
+    assert db.inserted.wait(5)
+    writer.stop()
+
+    assert db.orders == {1: "in progress", 2: "in progress", 3: "in progress"}
+    assert writer.stats()["dead_lettered"] == 0
+    assert not (tmp_path / "orders.journal.failed").exists()
+
+
+def test_rejected_order_is_dead_lettered(tmp_path, monkeypatch):
+    monkeypatch.setattr(order_journal, "RETRY_BACKOFF_INITIAL", 0.001)
+    monkeypatch.setattr(order_journal, "RETRY_BACKOFF_MAX", 0.001)
+    db = FakeDatabase()
+    db.rejected.add(2)
+    writer = make_writer(tmp_path / "orders.journal", db)
+    writer.start()
+    for order_id in range(1, 4):
+        writer.submit(order_id, [(1, 1, 550)], "in progress")
+
+    while writer.stats()["pending"]:
+        time.sleep(0.001)
+    writer.stop()
+
+    assert db.orders == {1: "in progress", 3: "in progress"}
+    assert writer.stats()["dead_lettered"] == 1
+    assert '"order_id":2' in (tmp_path / "orders.journal.failed").read_text()
+
+
+def test_restart_replays_accepted_orders(tmp_path):
+    path = tmp_path / "orders.journal"
+    db = FakeDatabase()
+    db.available = False
+    writer = make_writer(path, db)
+    writer.start()
+    writer.submit(1, [(1, 2, 1100)], "in progress")
+    writer.submit(2, [(3, 1, 400)], "in progress")
+    writer.stop(timeout=1)
+    writer.journal.close()
+
+    # Order 1 made it into the database just before the crash
+    db.orders[1] = "in progress"
+    db.available = True
+    restarted = make_writer(path, db)
+    restarted.start()
+    assert restarted.pending_status(2) == "in progress"
+    while restarted.stats()["pending"]:
+        time.sleep(0.001)
+    restarted.stop()
+
+    assert db.orders == {1: "in progress", 2: "in progress"}
+    assert restarted.stats()["drained"] == 2
+    assert restarted.journal.read_pending() == []
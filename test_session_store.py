@@ -0,0 +1,42 @@
+"""
+Tests for the in-memory session store
+"""
+
+import time
+from types import SimpleNamespace
+
+import session_store
+from session_store import SessionStore
+
+
+def fake_clock(monkeypatch):
+    """Replace the store's monotonic clock with one the test advances by hand"""
+    clock = [1000.0]
+    monkeypatch.setattr(session_store, "time", SimpleNamespace(monotonic=lambda: clock[0], time=time.time))
+    return clock
+
+
+def test_pop_ignores_expired_cart(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    store = SessionStore(ttl=60)
+    store.set("s1", "cart")
+
+    clock[0] += 61
+    assert store.pop("s1") is None
+    assert store.expired == 1
+    assert len(store) == 0
+
+
+def test_update_and_pop_sweep_expired_carts(monkeypatch):
+    clock = fake_clock(monkeypatch)
+    store = SessionStore(ttl=60)
+    store.set("old", "cart")
+
+    clock[0] += 61
+    store.update("new", lambda cart: "cart")
+    assert len(store) == 1
+
+    store.set("older", "cart")
+    clock[0] += 61
+    store.pop("missing")
+    assert len(store) == 0
@@ -0,0 +1,317 @@
+"""
+Sampled request tracing with nested spans
+
+A sampled webhook request gets a trace: a tree of timed spans for the
+request, its intent handler, each db_helper call and each SQL statement.
+The current span lives in a context variable. That lets spans nest across
+awaits, and across the DB thread pool, which copies the context into its
+worker threads. Finished traces are kept in an in-memory ring buffer for
+/debug/traces. If TRACE_EXPORT_PATH is set, they are also appended to a
+JSONL file, one trace per line, by a background thread.
+
+Unsampled requests only pay for a context variable lookup per span.
+"""
+
+import asyncio
+import atexit
+import contextvars
+import itertools
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from functools import wraps
+from typing import Any, Dict, List, Optional
+
+import json_codec
+
+logger = logging.getLogger(__name__)
+
+# Fraction of webhook requests traced (0 disables tracing, 1 traces everything)
+TRACE_SAMPLE_RATE = min(1.0, max(0.0, float(os.getenv("TRACE_SAMPLE_RATE", 0.01))))
+# Finished traces kept in memory for /debug/traces
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 500))
+# Append finished traces to this JSONL file; empty disables export
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def new_request_id() -> str:
+    """Random 16-hex-digit request ID"""
+    return os.urandom(8).hex()
+
+
+class Trace:
+    """Spans recorded for one request"""
+
+    __slots__ = ("request_id", "started_at", "origin", "spans", "_span_ids")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self._span_ids = itertools.count(1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        root = self.spans[0]
+        return {
+            "request_id": self.request_id,
+            "name": root.name,
+            "started_at": self.started_at,
+            "duration_ms": root.duration_ms(),
+            "attributes": root.attributes,
+            "error": root.error,
+            "spans": [span.to_dict() for span in sorted(self.spans, key=lambda span: span.start)],
+        }
+
+
+class Span:
+    """One timed operation inside a trace"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "duration", "attributes", "error")
+
+    def __init__(self, trace: Trace, name: str, parent: Optional["Span"], start: float):
+        self.trace = trace
+        self.span_id = next(trace._span_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.start = start
+        self.duration: Optional[float] = None
+        self.attributes: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        # list.append is atomic, so spans finishing in DB threads need no lock
+        trace.spans.append(self)
+
+    def duration_ms(self) -> Optional[float]:
+        return round(self.duration * 1000, 3) if self.duration is not None else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start - self.trace.origin) * 1000, 3),
+            "duration_ms": self.duration_ms(),
+        }
+        if self.attributes:
+            data["attributes"] = self.attributes
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class _NoopScope:
+    """Stands in for a span when the current request is not traced"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP = _NoopScope()
+
+
+class _SpanScope:
+    """Context manager that makes a span current until it finishes"""
+
+    __slots__ = ("span", "_token", "_root")
+
+    def __init__(self, span: Span, root: bool = False):
+        self.span = span
+        self._token = None
+        self._root = root
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        span = self.span
+        span.duration = time.perf_counter() - span.start
+        if exc_type is not None:
+            span.error = exc_type.__name__
+        _current.reset(self._token)
+        if self._root:
+            tracer.finish(span.trace)
+        return False
+
+
+class _JsonlExporter:
+    """Appends finished traces to a JSONL file from a background thread"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.exported = 0
+        self.failed = 0
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, trace: Trace) -> None:
+        self._queue.put(trace)
+
+    def stop(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        with open(self.path, "ab") as f:
+            while True:
+                trace = self._queue.get()
+                # Write everything already queued before flushing
+                batch = [trace]
+                while trace is not None and not self._queue.empty():
+                    trace = self._queue.get()
+                    batch.append(trace)
+                for item in batch:
+                    if item is None:
+                        continue
+                    try:
+                        f.write(json_codec.dumps(item.to_dict()) + b"\n")
+                        self.exported += 1
+                    except Exception as e:
+                        self.failed += 1
+                        logger.error("Failed to export trace %s: %s", item.request_id, e)
+                f.flush()
+                if batch[-1] is None:
+                    return
+
+
+class Tracer:
+    """Samples requests and keeps their finished traces"""
+
+    def __init__(self, sample_rate: float, buffer_size: int, export_path: str = ""):
+        self.sample_rate = sample_rate
+        self._finished: deque = deque(maxlen=max(1, buffer_size))
+        self._exporter = _JsonlExporter(export_path) if export_path else None
+        self.started = 0
+
+    def trace(self, name: str, request_id: Optional[str] = None, sampled: Optional[bool] = None):
+        """
+        Start a trace for one request, if the request is sampled
+
+        Args:
+            name: Name of the root span
+            request_id: ID to record the trace under; a random one by default
+            sampled: Force (True) or skip (False) tracing instead of sampling
+
+        Returns:
+            Context manager yielding the root span, or None when not traced
+        """
+        if sampled is None:
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled:
+            return _NOOP
+        self.started += 1
+        trace = Trace(request_id or new_request_id())
+        return _SpanScope(Span(trace, name, None, trace.origin), root=True)
+
+    def finish(self, trace: Trace) -> None:
+        self._finished.append(trace)
+        if self._exporter is not None:
+            self._exporter.submit(trace)
+
+    def recent(self, limit: int = 50, name: Optional[str] = None, min_ms: float = 0) -> List[Dict[str, Any]]:
+        """
+        Return finished traces, newest first
+
+        Args:
+            limit: Maximum number of traces returned
+            name: Only traces whose root span or one of its spans has this name
+            min_ms: Only traces that took at least this many milliseconds
+        """
+        results = []
+        for trace in reversed(list(self._finished)):
+            if len(results) >= limit:
+                break
+            if min_ms and (trace.spans[0].duration or 0) * 1000 < min_ms:
+                continue
+            if name and not any(span.name == name for span in trace.spans):
+                continue
+            results.append(trace.to_dict())
+        return results
+
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """Return the finished trace recorded under a request ID, or None"""
+        for trace in reversed(list(self._finished)):
+            if trace.request_id == request_id:
+                return trace.to_dict()
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sample_rate": self.sample_rate,
+            "started": self.started,
+            "buffered": len(self._finished),
+            "buffer_size": self._finished.maxlen,
+            "exported": self._exporter.exported if self._exporter else None,
+            "export_failures": self._exporter.failed if self._exporter else None,
+        }
+
+
+tracer = Tracer(TRACE_SAMPLE_RATE, TRACE_BUFFER_SIZE, TRACE_EXPORT_PATH)
+
+
+def span(name: str):
+    """
+    Time a block as a child of the current span
+
+    Returns a no-op context manager when the current request is not traced.
+    """
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    return _SpanScope(Span(parent.trace, name, parent, time.perf_counter()))
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """Attach an attribute to the current span, if any"""
+    current = _current.get()
+    if current is not None:
+        current.attributes[key] = value
+
+
+def traced(name: Optional[str] = None):
+    """Decorator that records each call of a function or coroutine as a span"""
+    def decorator(fn):
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        if asyncio.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if _current.get() is None:
+                    return await fn(*args, **kwargs)
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_statement(name: str, elapsed: float, failed: bool) -> None:
+    """StatementRegistry observer recording each SQL statement as a finished span"""
+    parent = _current.get()
+    if parent is None:
+        return
+    statement = Span(parent.trace, f"sql {name}", parent, time.perf_counter() - elapsed)
+    statement.duration = elapsed
+    if failed:
+        statement.error = "failed"